@@ -1,20 +1,35 @@
 from . import math
-from .common import shared_session, stats, time_api
+from .common import TimingRegistry, shared_session, stats, time_api, timing_registry
 from .config import Config
 from .logging import all_logging_disabled, configure_logging
-from .requests import request_with_retry
+from .requests import (
+    async_request_with_retry,
+    async_session,
+    request_many,
+    request_with_retry,
+)
+from .sketches import TDigest
 from .time_helpers import timestamp_millis
+from .tracing import Tracer, tracer
 from .version import __version__
 
 __all__ = [
     "configure_logging",
     "all_logging_disabled",
     "time_api",
+    "timing_registry",
+    "TimingRegistry",
     "shared_session",
     "stats",
+    "TDigest",
     "timestamp_millis",
+    "tracer",
+    "Tracer",
     "Config",
     "math",
     "request_with_retry",
+    "request_many",
+    "async_request_with_retry",
+    "async_session",
     "__version__",
 ]
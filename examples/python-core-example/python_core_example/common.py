@@ -1,13 +1,40 @@
+import array
+import atexit
 import functools
+import inspect
+import json
 import logging
+import math
+import random
 import socket
 import sys
+import threading
 import time
-from typing import Any, Callable, Dict, List, TypeVar, cast
+import types
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TypeVar,
+    Union,
+    overload,
+)
 
 import requests
 from urllib3.connection import HTTPConnection
 
+from .profiling import (
+    ProfileThreshold,
+    allocation_tracker,
+    parse_profile_threshold,
+    slow_call_profiler,
+)
+from .tracing import tracer
+
 _BaseDecoratedFunc = Callable[..., Any]
 DecoratedFunc = TypeVar("DecoratedFunc", bound=_BaseDecoratedFunc)
 
@@ -18,59 +45,460 @@ TCP_KEEPALIVE_INTERVAL = 10
 TCP_KEEPALIVE_PROBE_COUNT = 6
 
 
-# https://github.com/python/mypy/issues/1927
-def time_api(fn: DecoratedFunc) -> DecoratedFunc:
-    """A decorator to log the duration of a function call."""
-    call_name = fn.__qualname__
+# Percentiles reported by stats(), by label
+STATS_PERCENTILES = (
+    ("25th", 25),
+    ("50th", 50),
+    ("75th", 75),
+    ("90th", 90),
+    ("95th", 95),
+    ("99th", 99),
+    ("99.9th", 99.9),
+)
+# Inputs smaller than this are summarized in pure Python, which is faster than numpy (and importing it)
+STATS_PYTHON_MAX_SIZE = 1_000
+# Anything numpy.asarray accepts, ideally without copying
+StatsInput = Union[Sequence[float], array.array, memoryview]
+
+# Summarize aggregated timings at most once a minute
+TIMING_FLUSH_INTERVAL = 60
+# Bound the memory held per call name (8 bytes per sample) between flushes
+TIMING_MAX_SAMPLES = 100_000
+# Individual calls slower than this (seconds) are still logged as they happen
+TIMING_LOG_THRESHOLD = 1.0
+
+
+class TimingRegistry:
+    """An in-process registry of call durations, aggregated by call name.
+
+    Every duration is appended to a compact ``array.array`` buffer for its call name. Buffers are summarized with
+    :func:`stats` and logged once per call name when flushed, so hot functions are visible in aggregate without
+    paying for a log line per call.
+    """
+
+    def __init__(
+        self,
+        flush_interval: Optional[float] = TIMING_FLUSH_INTERVAL,
+        max_samples: int = TIMING_MAX_SAMPLES,
+        log_threshold: Optional[float] = TIMING_LOG_THRESHOLD,
+    ):
+        """Create a registry.
+
+        :param flush_interval: Seconds between automatic flushes, or None to only flush explicitly (and at exit).
+        :param max_samples: Flush once any call name has buffered this many durations.
+        :param log_threshold: Log individual calls at least this slow (seconds), or None to never log per call.
+        """
+        self.flush_interval = flush_interval
+        self.max_samples = max_samples
+        self.log_threshold = log_threshold
+        self._lock = threading.Lock()
+        self._durations: Dict[str, array.array] = {}
+        self._last_flush = time.perf_counter()
+
+    def record(self, name: str, duration: float, now: Optional[float] = None) -> None:
+        """Record a single call duration.
+
+        :param name: The call name, typically the function ``__qualname__``.
+        :param duration: The call duration in seconds.
+        :param now: The current ``time.perf_counter()`` value, if the caller already has it.
+        """
+        if self.log_threshold is not None and duration >= self.log_threshold:
+            logger.info(
+                r"TIMING - {\"method\": \"%s\", \"duration\": %.2f}",
+                name,
+                duration,
+            )
+        self.observe(name, duration, now=now)
+
+    def observe(self, name: str, value: float, now: Optional[float] = None) -> None:
+        """Record a single value that isn't a call duration (e.g. allocated bytes), without any per-call logging.
+
+        :param name: The metric name, e.g. ``"<call name>[alloc_peak]"``.
+        :param value: The value to summarize.
+        :param now: The current ``time.perf_counter()`` value, if the caller already has it.
+        """
+        values = self._durations.get(name)
+        if values is None:
+            with self._lock:
+                values = self._durations.setdefault(name, array.array("d"))
+        # array.append is atomic under the GIL, so the hot path never takes the lock
+        values.append(value)
+        if len(values) >= self.max_samples:
+            self.flush()
+        elif self.flush_interval is not None:
+            if now is None:
+                now = time.perf_counter()
+            if now - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def _drain(self) -> Dict[str, array.array]:
+        """Remove and return all buffered durations, keeping any appended concurrently."""
+        drained = {}
+        for name, durations in list(self._durations.items()):
+            count = len(durations)
+            if not count:
+                continue
+            drained[name] = durations[:count]
+            del durations[:count]
+        return drained
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Summarize the buffered durations for each call name without resetting them."""
+        with self._lock:
+            snapshot = {
+                name: durations[:]
+                for name, durations in self._durations.items()
+                if len(durations)
+            }
+        return {name: stats(durations) for name, durations in snapshot.items()}
+
+    def flush(self) -> Dict[str, Dict[str, float]]:
+        """Summarize, log, and reset the buffered durations for each call name.
+
+        :returns: The summary statistics for each call name that recorded durations since the last flush.
+        """
+        with self._lock:
+            self._last_flush = time.perf_counter()
+            drained = self._drain()
+        summaries = {}
+        for name, durations in drained.items():
+            summaries[name] = stats(durations)
+            logger.info(
+                "TIMING_SUMMARY - %s",
+                json.dumps({"method": name, **summaries[name]}),
+            )
+        return summaries
+
+    def reset(self) -> None:
+        """Discard all buffered durations."""
+        with self._lock:
+            self._last_flush = time.perf_counter()
+            self._durations.clear()
+
+
+timing_registry = TimingRegistry()
+atexit.register(timing_registry.flush)
+
+
+class _TimeApiOptions(NamedTuple):
+    cpu_time: bool = False
+    profile_threshold: Optional[ProfileThreshold] = None
+    track_allocations: float = 0.0
+
+
+class _CallTimer:
+    """Measures a single decorated call and records it in the :data:`timing_registry` when finished.
+
+    When tracing is enabled the call is also traced as a span, nested under the current span. When a profile threshold
+    is set, the call is registered with the slow call profiler. When allocation tracking samples the call, its peak
+    and net allocated bytes are recorded too.
+    """
+
+    __slots__ = (
+        "name",
+        "options",
+        "cpu",
+        "start",
+        "span",
+        "token",
+        "profiled",
+        "allocations",
+    )
+
+    def __init__(self, name: str, options: _TimeApiOptions, activate: bool = True):
+        self.name = name
+        self.options = options
+        self.cpu = 0.0
+        self.span = self.token = self.profiled = self.allocations = None
+        if options.track_allocations and (
+            options.track_allocations >= 1
+            or random.random() < options.track_allocations
+        ):
+            self.allocations = allocation_tracker.start()
+        if options.profile_threshold is not None:
+            self.profiled = slow_call_profiler.start(name, options.profile_threshold)
+        self.start = time.perf_counter()
+        if tracer.enabled:
+            self.span, self.token = tracer.start_span(
+                name, start=self.start, activate=activate
+            )
+
+    def finish(self) -> None:
+        end = time.perf_counter()
+        duration = end - self.start
+        if self.allocations is not None:
+            net, peak = allocation_tracker.finish(self.allocations)
+            timing_registry.observe(f"{self.name}[alloc_peak]", peak, now=end)
+            timing_registry.observe(f"{self.name}[alloc_net]", net, now=end)
+        if self.span is not None:
+            tracer.end_span(self.span, self.token, end=end)
+        timing_registry.record(self.name, duration, now=end)
+        if self.options.cpu_time:
+            timing_registry.record(f"{self.name}[cpu]", self.cpu, now=end)
+        if self.options.profile_threshold is not None:
+            if self.profiled is not None:
+                slow_call_profiler.finish(self.profiled, duration)
+            slow_call_profiler.observe(
+                self.name, duration, self.options.profile_threshold
+            )
+
+
+@types.coroutine
+def _drive(awaitable: Awaitable, timer: _CallTimer):
+    """Await an awaitable one step at a time, adding the CPU time spent in each step (not suspended) to the timer."""
+    steps = awaitable.__await__()
+    value: Any = None
+    error: Optional[BaseException] = None
+    while True:
+        c1 = time.thread_time()
+        try:
+            yielded = steps.send(value) if error is None else steps.throw(error)
+        except StopIteration as e:
+            return e.value
+        finally:
+            timer.cpu += time.thread_time() - c1
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:
+            value, error = None, e
+
+
+def _time_function(fn: Callable, call_name: str, options: _TimeApiOptions) -> Callable:
+    cpu_time = options.cpu_time
 
     @functools.wraps(fn)
     def _run(*args, **kwargs):
-        t1 = time.perf_counter()
-        res = fn(*args, **kwargs)
-        t2 = time.perf_counter()
-        delta = t2 - t1
-        # Only log significant function calls (>=10 millis) to avoid unnecessary log lines
-        # NOTE: This could hide methods that are called many times and lead to large runtimes
-        # on aggregate. In general these aren't common, so we ignore them here. Can always
-        # enable finer grained logging later if this doesn't detect perf issues (e.g. overall runtime)
-        # is significantly longer than logged runtime)
-        if delta < 0.01:
-            return res
-
-        logger.info(
-            r"TIMING - {\"method\": \"%s\", \"duration\": %.2f}",
-            call_name,
-            t2 - t1,
+        timer = _CallTimer(call_name, options)
+        c1 = time.thread_time() if cpu_time else 0.0
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if cpu_time:
+                timer.cpu = time.thread_time() - c1
+            timer.finish()
+
+    return _run
+
+
+def _time_coroutine_function(
+    fn: Callable, call_name: str, options: _TimeApiOptions
+) -> Callable:
+    @functools.wraps(fn)
+    async def _run(*args, **kwargs):
+        timer = _CallTimer(call_name, options)
+        try:
+            if options.cpu_time:
+                return await _drive(fn(*args, **kwargs), timer)
+            return await fn(*args, **kwargs)
+        finally:
+            timer.finish()
+
+    return _run
+
+
+def _time_async_generator_function(
+    fn: Callable, call_name: str, options: _TimeApiOptions
+) -> Callable:
+    @functools.wraps(fn)
+    async def _run(*args, **kwargs):
+        agen = fn(*args, **kwargs)
+        # The generator's context is shared with its consumer between items, so its span can't be made current
+        timer = _CallTimer(call_name, options, activate=False)
+        try:
+            step = agen.asend(None)
+            while True:
+                try:
+                    item = await (_drive(step, timer) if options.cpu_time else step)
+                except StopAsyncIteration:
+                    return
+                try:
+                    sent = yield item
+                except GeneratorExit:
+                    await agen.aclose()
+                    raise
+                except BaseException as e:
+                    step = agen.athrow(e)
+                else:
+                    step = agen.asend(sent)
+        finally:
+            timer.finish()
+
+    return _run
+
+
+@overload
+def time_api(fn: DecoratedFunc) -> DecoratedFunc:
+    ...
+
+
+@overload
+def time_api(
+    *,
+    cpu_time: bool = False,
+    profile_threshold: Optional[ProfileThreshold] = None,
+    track_allocations: Union[bool, float] = False,
+) -> Callable[[DecoratedFunc], DecoratedFunc]:
+    ...
+
+
+# https://github.com/python/mypy/issues/1927
+def time_api(
+    fn=None, *, cpu_time=False, profile_threshold=None, track_allocations=False
+):
+    """A decorator to record the duration of every function call in the :data:`timing_registry`.
+
+    Coroutine functions and async generator functions are timed from the first step until they finish (or the
+    generator is exhausted or closed), rather than just the creation of the coroutine object.
+
+    When :data:`~python_core_example.tracing.tracer` is enabled, nested decorated calls are also traced as parent and
+    child spans.
+
+    Usable as ``@time_api`` or ``@time_api(cpu_time=True)``.
+
+    :param cpu_time: Also record the CPU time spent in the call under ``"<name>[cpu]"``. For coroutines and async
+        generators this excludes time spent suspended, so wall time minus CPU time is the time spent waiting.
+    :param profile_threshold: Capture a stack profile of individual calls slower than this, either in seconds or as a
+        running percentile of the call's own durations like ``"p99"``. See
+        :class:`~python_core_example.profiling.SlowCallProfiler`. Ignored for coroutine functions and async generator
+        functions, whose thread runs other tasks while they are suspended.
+    :param track_allocations: Record the peak and net bytes allocated during calls under ``"<name>[alloc_peak]"`` and
+        ``"<name>[alloc_net]"``. Either True to track every call, or the fraction of calls to sample (e.g. ``0.01``)
+        to bound the overhead. See :class:`~python_core_example.profiling.AllocationTracker`.
+    """
+    if profile_threshold is not None:
+        profile_threshold = parse_profile_threshold(profile_threshold)
+    if not 0 <= track_allocations <= 1:
+        raise ValueError(
+            f"Invalid track_allocations: {track_allocations}. Expected a bool or a fraction of calls."
         )
-        return res
+    options = _TimeApiOptions(
+        cpu_time=cpu_time,
+        profile_threshold=profile_threshold,
+        track_allocations=float(track_allocations),
+    )
+    if fn is None:
+        return functools.partial(time_api, **options._asdict())
+
+    call_name = fn.__qualname__
+    if inspect.isasyncgenfunction(fn):
+        options = options._replace(profile_threshold=None)
+        return _time_async_generator_function(fn, call_name, options)
+    if inspect.iscoroutinefunction(fn):
+        options = options._replace(profile_threshold=None)
+        return _time_coroutine_function(fn, call_name, options)
+    return _time_function(fn, call_name, options)
 
-    return cast(DecoratedFunc, _run)
+
+def _interpolate(ordered: Sequence[float], percentile: float) -> float:
+    """Linearly interpolate a percentile of sorted values, exactly as numpy.percentile's default method does."""
+    position = percentile / 100 * (len(ordered) - 1)
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    fraction = position - low
+    low_value, high_value = ordered[low], ordered[high]
+    if fraction >= 0.5:
+        return high_value - (high_value - low_value) * (1 - fraction)
+    return low_value + (high_value - low_value) * fraction
+
+
+def _python_stats(values: StatsInput) -> Dict[str, Any]:
+    """Calculate :func:`stats` of a one dimensional input in pure Python, sorting the values once."""
+    ordered = sorted(values)
+    count = len(ordered)
+    if not count:
+        raise ValueError("Can't calculate statistics of an empty set of values")
+    total = sum(ordered)
+    mean = total / count
+    percentiles = {label: _interpolate(ordered, q) for label, q in STATS_PERCENTILES}
+    return {
+        **percentiles,
+        "mean": mean,
+        "stdev": math.sqrt(sum((v - mean) ** 2 for v in ordered) / count),
+        "median": percentiles["50th"],
+        "count": count,
+        "total": total,
+        "max": ordered[-1],
+        "min": ordered[0],
+    }
 
 
-def stats(values: List[float]) -> Dict[str, float]:
+def stats(values: StatsInput, axis: Optional[int] = None) -> Dict[str, Any]:
     """Calculate percentiles and other summary statistics of a list of values.
 
-    Note: Requires numpy to be installed.
+    Accepts any sequence of numbers. NumPy arrays, ``array.array`` and other buffer protocol objects (e.g.
+    ``memoryview``) are used without copying. The input is converted to an array once, and all percentiles are
+    computed with a single partition of the data.
+
+    Small one dimensional inputs (fewer than ``STATS_PYTHON_MAX_SIZE`` values), and any one dimensional input when
+    numpy isn't installed, are summarized in pure Python instead, so short-lived processes summarizing a few hundred
+    values never pay for importing numpy. Both give the same results.
+
+    Note: Requires numpy to be installed to summarize along an axis.
+
+    :param values: The values to summarize.
+    :param axis: Summarize each series along this axis of a multi-dimensional input (e.g. ``axis=0`` for each column
+        of a 2-D array) in one vectorized call, returning arrays of statistics. By default the input is flattened and
+        summarized as a single series, returning scalars.
+    :returns: A dictionary of summary statistics, keyed by name.
+    :raises: A ValueError if there are no values to summarize.
     """
-    # Don't require numpy in requirements.txt - not required for main execution and increases image size unnecessarily
-    import numpy
+    loaded_numpy = sys.modules.get("numpy")
+    one_dimensional = axis is None and not (
+        (loaded_numpy is not None and isinstance(values, loaded_numpy.ndarray))
+        or (isinstance(values, memoryview) and values.ndim != 1)
+    )
+    if one_dimensional and len(values) < STATS_PYTHON_MAX_SIZE:
+        return _python_stats(values)
 
-    return {
-        "25th": numpy.percentile(values, 25),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "50th": numpy.percentile(values, 50),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "75th": numpy.percentile(values, 70),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "90th": numpy.percentile(values, 90),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "95th": numpy.percentile(values, 95),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "99th": numpy.percentile(values, 99),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "99.9th": numpy.percentile(values, 99.9),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "mean": float(numpy.mean(values)),
-        "stdev": float(numpy.std(values)),
-        "median": numpy.median(values),  # type: ignore # https://github.com/Project-MONAI/MONAI/issues/3561
-        "count": len(values),
-        "total": sum(values),
-        "max": max(values),
-        "min": min(values),
+    try:
+        # Don't require numpy in requirements.txt - not required for main execution and increases image size unnecessarily
+        import numpy
+    except ModuleNotFoundError:
+        if not one_dimensional:
+            raise
+        return _python_stats(values)
+
+    data = numpy.asarray(values)
+    # Lists and other non-buffer inputs were converted to a new array we own, so the percentile partition can reuse it
+    owned = not isinstance(values, numpy.ndarray) and data.base is None
+    if data.size == 0 or (axis is not None and data.shape[axis] == 0):
+        raise ValueError("Can't calculate statistics of an empty set of values")
+    if axis is None:
+        data = data.reshape(-1)
+        count = data.size
+    else:
+        count = data.shape[axis]
+
+    total = data.sum(axis=axis)
+    moments = {
+        "mean": total / count,
+        "stdev": data.std(axis=axis),
+    }
+    extremes = {
+        "count": count,
+        "total": total,
+        "max": data.max(axis=axis),
+        "min": data.min(axis=axis),
+    }
+    # Percentiles last, since they may partition the data in place
+    percentiles = numpy.percentile(
+        data,
+        [q for _, q in STATS_PERCENTILES],
+        axis=axis if axis is not None else 0,
+        overwrite_input=owned,
+    )
+    summary = {
+        **{label: p for (label, _), p in zip(STATS_PERCENTILES, percentiles)},
+        **moments,
+        "median": percentiles[1],
+        **extremes,
     }
+    if axis is None:
+        return {
+            k: v.item() if isinstance(v, numpy.generic) else v
+            for k, v in summary.items()
+        }
+    return summary
 
 
 def _set_socket_options():
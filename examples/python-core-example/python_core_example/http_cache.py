@@ -0,0 +1,368 @@
+import collections
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+import requests
+import requests.sessions
+import requests.structures
+
+# Responses kept in memory by default, least recently used first out
+HTTP_CACHE_MAX_ENTRIES = 1_000
+
+
+def _parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into lower case directives and their values, if any."""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _parse_seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _parse_date(value: Optional[str]) -> Optional[float]:
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _expires(headers: Mapping[str, str], now: float) -> float:
+    """Get the time a response stops being fresh, from its Cache-Control, Age and Expires headers."""
+    cache_control = _parse_cache_control(headers.get("Cache-Control"))
+    if "no-cache" in cache_control:
+        return now
+    max_age = _parse_seconds(cache_control.get("max-age"))
+    if max_age is not None:
+        return now + max_age - (_parse_seconds(headers.get("Age")) or 0)
+    expires = _parse_date(headers.get("Expires"))
+    if expires is not None:
+        # Relative to the server's clock
+        date = _parse_date(headers.get("Date"))
+        return now + expires - date if date is not None else expires
+    # Without explicit freshness, only reuse responses after revalidating them
+    return now
+
+
+def _sends_credentials(
+    headers: Optional[Mapping[str, str]], session: Optional[requests.Session]
+) -> bool:
+    """Check if a request carries credentials, from its own headers or the session sending it."""
+    request_headers = requests.structures.CaseInsensitiveDict(headers or {})
+    if session is not None:
+        if session.auth is not None or session.cookies:
+            return True
+        # Headers set to None on the request remove the session's
+        request_headers = requests.sessions.merge_setting(
+            request_headers,
+            session.headers,
+            dict_class=requests.structures.CaseInsensitiveDict,
+        )
+    return "Authorization" in request_headers or "Cookie" in request_headers
+
+
+class CacheEntry:
+    """A cached response, and the request headers it varies on."""
+
+    __slots__ = (
+        "status_code",
+        "headers",
+        "content",
+        "url",
+        "encoding",
+        "expires",
+        "vary",
+    )
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Mapping[str, str],
+        content: bytes,
+        url: str,
+        encoding: Optional[str],
+        expires: float,
+        vary: Tuple[Tuple[str, Optional[str]], ...],
+    ):
+        self.status_code = status_code
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.content = content
+        self.url = url
+        self.encoding = encoding
+        self.expires = expires
+        self.vary = vary
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        """Whether the response can be reused without revalidating it."""
+        return (time.time() if now is None else now) < self.expires
+
+    def validators(self) -> Dict[str, str]:
+        """Get the conditional request headers that revalidate the response, if it has an ETag or Last-Modified."""
+        validators = {}
+        if "ETag" in self.headers:
+            validators["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            validators["If-Modified-Since"] = self.headers["Last-Modified"]
+        return validators
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the entry, except its content, to a JSON serializable dict."""
+        return {
+            "status_code": self.status_code,
+            "headers": dict(self.headers),
+            "url": self.url,
+            "encoding": self.encoding,
+            "expires": self.expires,
+            "vary": [list(pair) for pair in self.vary],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any], content: bytes) -> "CacheEntry":
+        """Create an entry from :meth:`to_dict` output and its content."""
+        return cls(
+            data["status_code"],
+            data["headers"],
+            content,
+            data["url"],
+            data["encoding"],
+            data["expires"],
+            tuple((name, value) for name, value in data["vary"]),
+        )
+
+    def to_response(self) -> requests.Response:
+        """Build a new response object from the entry."""
+        response = requests.Response()
+        response.status_code = self.status_code
+        response.headers = requests.structures.CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response.url = self.url
+        response.encoding = self.encoding
+        return response
+
+
+class ResponseCache:
+    """A cache of successful GET responses, for :func:`~python_core_example.requests.request_with_retry`.
+
+    Responses are kept in an in-memory LRU, and if a directory is given, also written to disk so they outlive the
+    process and are shared with other processes. Entries are keyed on the method, URL and params, and only match
+    requests with the same values of the headers listed in the response's Vary header (one variant is kept per key).
+
+    Freshness follows the response's Cache-Control (``max-age``, ``no-cache`` and ``no-store``), Age and Expires
+    headers. Fresh responses are returned without a request. Stale responses with an ETag or Last-Modified header
+    are revalidated with a conditional request, so an unchanged resource costs a 304 round trip instead of a
+    download. Requests with ``Cache-Control: no-cache`` always revalidate, and ``no-store`` bypasses the cache, as do
+    requests with credentials (an ``Authorization`` or ``Cookie`` header, or a session with auth or cookies), so
+    responses for one set of credentials are never served to another.
+
+    Entries on disk are a line of JSON metadata (status, headers, URL and freshness) followed by the raw body, so
+    reading a file written by another process never executes code from it.
+    """
+
+    def __init__(
+        self, max_entries: int = HTTP_CACHE_MAX_ENTRIES, directory: Optional[str] = None
+    ):
+        """Create a cache.
+
+        :param max_entries: The maximum number of responses kept in memory.
+        :param directory: A directory to also store responses in. Not size bounded, so it should be cleaned up
+            externally.
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries: "collections.OrderedDict[str, CacheEntry]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method: str, url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        """Get the key of a request, before considering its Vary headers."""
+        key = f"{method.upper()} {url}"
+        if params:
+            key += "?" + urlencode(sorted(params.items()), doseq=True)
+        return key
+
+    def _path(self, key: str) -> str:
+        return os.path.join(
+            self.directory or "", hashlib.sha256(key.encode()).hexdigest() + ".response"
+        )
+
+    def get(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, Any]] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> Optional[CacheEntry]:
+        """Get the cached response for a request, fresh or not, if its Vary headers match."""
+        key = self.key(method, url, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.directory is not None:
+            entry = self._load(key)
+            if entry is None:
+                return None
+            self._remember(key, entry)
+        if entry is None:
+            return None
+        request_headers = requests.structures.CaseInsensitiveDict(headers or {})
+        if any(request_headers.get(name) != value for name, value in entry.vary):
+            return None
+        return entry
+
+    def put(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, Any]],
+        headers: Optional[Mapping[str, str]],
+        response: requests.Response,
+    ) -> Optional[CacheEntry]:
+        """Cache a response, if it's cacheable.
+
+        :returns: The new entry, or None if the response can't be cached.
+        """
+        if response.status_code != 200:
+            return None
+        cache_control = _parse_cache_control(response.headers.get("Cache-Control"))
+        vary = [
+            name.strip()
+            for name in response.headers.get("Vary", "").split(",")
+            if name.strip()
+        ]
+        if "no-store" in cache_control or "*" in vary:
+            return None
+        expires = _expires(response.headers, time.time())
+        entry = CacheEntry(
+            response.status_code,
+            response.headers,
+            response.content,
+            response.url or url,
+            response.encoding,
+            expires,
+            (),
+        )
+        if expires <= time.time() and not entry.validators():
+            return None
+        request_headers = requests.structures.CaseInsensitiveDict(headers or {})
+        entry.vary = tuple((name, request_headers.get(name)) for name in vary)
+        self._store(self.key(method, url, params), entry)
+        return entry
+
+    def revalidated(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, Any]],
+        entry: CacheEntry,
+        response: requests.Response,
+    ) -> CacheEntry:
+        """Refresh an entry from a 304 Not Modified response to its conditional request."""
+        headers = requests.structures.CaseInsensitiveDict(entry.headers)
+        headers.update(response.headers)
+        refreshed = CacheEntry(
+            entry.status_code,
+            headers,
+            entry.content,
+            entry.url,
+            entry.encoding,
+            _expires(headers, time.time()),
+            entry.vary,
+        )
+        self._store(self.key(method, url, params), refreshed)
+        return refreshed
+
+    def fetch(
+        self,
+        method: str,
+        url: str,
+        params: Optional[Mapping[str, Any]],
+        headers: Optional[Mapping[str, str]],
+        send: Callable[[Optional[Mapping[str, str]]], requests.Response],
+        session: Optional[requests.Session] = None,
+    ) -> requests.Response:
+        """Get the response to a request through the cache.
+
+        :param method: The request method, only GET requests are cached.
+        :param url: The request URL.
+        :param params: The request query parameters.
+        :param headers: The request headers.
+        :param send: A function sending the request with the given headers, which may include conditional headers.
+        :param session: The session sending the request, whose auth, cookies and headers also count as credentials.
+        :returns: A cached, revalidated or new response.
+        """
+        request_headers = requests.structures.CaseInsensitiveDict(headers or {})
+        cache_control = _parse_cache_control(request_headers.get("Cache-Control"))
+        if (
+            method.upper() != "GET"
+            or "no-store" in cache_control
+            or _sends_credentials(headers, session)
+        ):
+            return send(headers)
+        entry = self.get(method, url, params, headers)
+        if entry is not None:
+            if entry.is_fresh() and "no-cache" not in cache_control:
+                return entry.to_response()
+            validators = entry.validators()
+            if validators:
+                response = send({**(headers or {}), **validators})
+                if response.status_code == 304:
+                    return self.revalidated(
+                        method, url, params, entry, response
+                    ).to_response()
+                self.put(method, url, params, headers, response)
+                return response
+        response = send(headers)
+        self.put(method, url, params, headers, response)
+        return response
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        """Read an entry from the disk tier, or None if it's missing or unreadable."""
+        try:
+            with open(self._path(key), "rb") as f:
+                metadata = f.readline()
+                content = f.read()
+            return CacheEntry.from_dict(json.loads(metadata), content)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Write then rename, so concurrent readers never see a partial file
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}"
+        with open(temporary, "wb") as f:
+            # JSON escapes newlines, so the metadata is always exactly the first line
+            f.write(json.dumps(entry.to_dict()).encode() + b"\n")
+            f.write(entry.content)
+        os.replace(temporary, path)
+
+    def clear(self) -> None:
+        """Remove every entry from memory, leaving the disk tier untouched."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,30 @@
+from .ann import IVFIndex
+from .kernels import (
+    as_arrays,
+    cosine_similarity,
+    dot_product,
+    matrix_vector_product,
+    norm,
+)
+from .parallel import SharedVector, parallel_dot_product
+from .search import top_k_dot_products
+from .sparse import SparseMatrix, SparseVector
+from .store import VectorStore
+from .streaming import iter_blocks, streaming_dot_product
+
+__all__ = [
+    "as_arrays",
+    "IVFIndex",
+    "cosine_similarity",
+    "dot_product",
+    "matrix_vector_product",
+    "norm",
+    "parallel_dot_product",
+    "SharedVector",
+    "SparseMatrix",
+    "SparseVector",
+    "iter_blocks",
+    "streaming_dot_product",
+    "top_k_dot_products",
+    "VectorStore",
+]
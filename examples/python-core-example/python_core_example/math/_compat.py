@@ -0,0 +1,39 @@
+from typing import Any, Optional
+
+
+def optional_numpy() -> Optional[Any]:
+    """Import numpy if it's installed, for kernels with a pure Python fallback."""
+    try:
+        # Don't require numpy in requirements.txt - not required for main execution and increases image size unnecessarily
+        import numpy
+    except ModuleNotFoundError:
+        return None
+    return numpy
+
+
+def require_numpy() -> Any:
+    """Import numpy, for features that can't work without it.
+
+    :raises: A ModuleNotFoundError if numpy isn't installed.
+    """
+    numpy = optional_numpy()
+    if numpy is None:
+        raise ModuleNotFoundError(
+            "This feature requires numpy, which isn't installed", name="numpy"
+        )
+    return numpy
+
+
+def widen(numpy: Any, values: Any) -> Any:
+    """Promote a boolean or integer array to ``int64``, so products and sums don't overflow its narrow type.
+
+    :raises: A ValueError for ``uint64`` arrays, which no signed type can hold.
+    """
+    values = numpy.asarray(values)
+    if values.dtype.kind == "u" and values.dtype.itemsize >= 8:
+        raise ValueError(
+            f"Can't reduce {values.dtype} values exactly, convert them to int64 or float64 first"
+        )
+    if values.dtype.kind in "biu":
+        return values.astype(numpy.int64, copy=False)
+    return values
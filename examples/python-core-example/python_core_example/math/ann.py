@@ -0,0 +1,252 @@
+import math
+from typing import Any, List, Optional, Tuple
+
+from ._compat import require_numpy
+from .search import TOP_K_BLOCK_BYTES
+
+# Lists probed per query by default. Higher values trade query latency for recall.
+IVF_N_PROBE = 8
+# k-means iterations used to train the coarse quantizer
+IVF_KMEANS_ITERATIONS = 10
+# Train on at most this many vectors per list, which is plenty to place the centroids
+IVF_TRAINING_SAMPLES_PER_LIST = 64
+
+
+def _assign(numpy: Any, vectors: Any, centroids: Any) -> Any:
+    """Find the nearest (Euclidean) centroid of each vector, in blocks to bound memory."""
+    centroids = centroids.astype(vectors.dtype, copy=False)
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    rows_per_block = max(1, TOP_K_BLOCK_BYTES // max(1, 8 * len(centroids)))
+    assignments = numpy.empty(len(vectors), dtype=numpy.intp)
+    for start in range(0, len(vectors), rows_per_block):
+        block = vectors[start : start + rows_per_block]
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 doesn't change the nearest centroid
+        distances = centroid_norms - 2 * (block @ centroids.T)
+        assignments[start : start + rows_per_block] = distances.argmin(axis=1)
+    return assignments
+
+
+def _kmeans(numpy: Any, vectors: Any, clusters: int, iterations: int, rng: Any) -> Any:
+    """Train centroids with Lloyd's algorithm, starting from randomly chosen vectors."""
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].astype(
+        numpy.float64
+    )
+    for _ in range(iterations):
+        assignments = _assign(numpy, vectors, centroids)
+        counts = numpy.bincount(assignments, minlength=clusters)
+        # Sum each cluster's vectors over contiguous runs of the sorted assignments
+        order = numpy.argsort(assignments, kind="stable")
+        starts = numpy.cumsum(counts) - counts
+        present = counts > 0
+        sums = numpy.zeros_like(centroids)
+        sums[present] = numpy.add.reduceat(vectors[order], starts[present], axis=0)
+        empty = ~present
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Restart empty clusters from random vectors
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids.astype(vectors.dtype)
+
+
+class IVFIndex:
+    """An approximate nearest neighbor index for dot product search, using an inverted file (IVF).
+
+    Vectors are grouped into lists by their nearest k-means centroid. A query only scores the vectors in the
+    ``n_probe`` lists whose centroids are nearest to it, exactly, with
+    :func:`~python_core_example.math.search.top_k_dot_products` style partial selection. Raising ``n_probe`` increases
+    recall towards the exact search at the cost of latency. Works best with normalized vectors (cosine similarity),
+    where the nearest centroids are also the highest scoring ones.
+
+    Note: Requires numpy to be installed.
+    """
+
+    def __init__(self, centroids: Any, n_probe: int = IVF_N_PROBE):
+        """Create an empty index with trained centroids, see :meth:`build` to train and fill one.
+
+        :param centroids: The coarse quantizer centroids, one per list (lists x dimension).
+        :param n_probe: The default number of lists to search per query.
+        """
+        numpy = require_numpy()
+
+        self._numpy = numpy
+        self.centroids = numpy.asarray(centroids)
+        self.n_probe = n_probe
+        self._vectors = numpy.empty((0, self.centroids.shape[1]), self.centroids.dtype)
+        self._ids = numpy.empty(0, dtype=numpy.int64)
+        # Lists are contiguous ranges of vectors: list i is vectors[offsets[i]:offsets[i + 1]]
+        self._offsets = numpy.zeros(len(self.centroids) + 1, dtype=numpy.int64)
+        # Batches added since the lists were last merged, as (lists, vectors, ids)
+        self._pending: List[Tuple[Any, Any, Any]] = []
+        self._pending_count = 0
+        self._next_id = 0
+
+    @classmethod
+    def build(
+        cls,
+        vectors: Any,
+        n_lists: Optional[int] = None,
+        n_probe: int = IVF_N_PROBE,
+        iterations: int = IVF_KMEANS_ITERATIONS,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Train an index on vectors and add them to it, with ids matching their positions.
+
+        :param vectors: The vectors to index (n x dimension).
+        :param n_lists: The number of lists, defaulting to ``sqrt(n)``.
+        :param n_probe: The default number of lists to search per query.
+        :param iterations: The k-means training iterations.
+        :param seed: The random seed for training.
+        """
+        numpy = require_numpy()
+
+        vectors = numpy.asarray(vectors)
+        if n_lists is None:
+            n_lists = int(math.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+        rng = numpy.random.default_rng(seed)
+        sample_size = min(len(vectors), n_lists * IVF_TRAINING_SAMPLES_PER_LIST)
+        sample = vectors[
+            numpy.sort(rng.choice(len(vectors), sample_size, replace=False))
+        ]
+        index = cls(_kmeans(numpy, sample, n_lists, iterations, rng), n_probe=n_probe)
+        index.add(vectors)
+        return index
+
+    @property
+    def vectors(self) -> Any:
+        """The indexed vectors, grouped by list."""
+        self._merge_pending()
+        return self._vectors
+
+    @property
+    def ids(self) -> Any:
+        """The id of each indexed vector."""
+        self._merge_pending()
+        return self._ids
+
+    @property
+    def offsets(self) -> Any:
+        """The start of each list in :attr:`vectors`, followed by the number of vectors."""
+        self._merge_pending()
+        return self._offsets
+
+    def __len__(self) -> int:
+        return len(self._ids) + self._pending_count
+
+    def add(self, vectors: Any, ids: Optional[Any] = None) -> None:
+        """Add vectors to their nearest lists.
+
+        Batches are buffered and merged into the lists together by the next query (or save), so adding many small
+        batches doesn't rebuild the lists each time.
+
+        :param vectors: The vectors to add (n x dimension).
+        :param ids: The ids to return for the vectors in query results, defaulting to consecutive ids after the
+            highest id in the index.
+        """
+        numpy = self._numpy
+        vectors = numpy.atleast_2d(numpy.asarray(vectors, dtype=self._vectors.dtype))
+        if ids is None:
+            ids = numpy.arange(self._next_id, self._next_id + len(vectors))
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        if not len(ids):
+            return
+        self._pending.append((_assign(numpy, vectors, self.centroids), vectors, ids))
+        self._pending_count += len(ids)
+        self._next_id = max(self._next_id, int(ids.max()) + 1)
+
+    def _merge_pending(self) -> None:
+        """Insert the buffered batches at the end of their lists, sorting only the new vectors."""
+        if not self._pending:
+            return
+        numpy = self._numpy
+        lists, vectors, ids = (
+            numpy.concatenate(parts) for parts in zip(*self._pending)
+        )
+        self._pending = []
+        self._pending_count = 0
+        order = numpy.argsort(lists, kind="stable")
+        lists = lists[order]
+        positions = self._offsets[lists + 1]
+        self._vectors = numpy.insert(self._vectors, positions, vectors[order], axis=0)
+        self._ids = numpy.insert(self._ids, positions, ids[order])
+        self._offsets[1:] += numpy.cumsum(
+            numpy.bincount(lists, minlength=len(self.centroids))
+        )
+
+    def _query_one(self, query: Any, k: int, n_probe: int) -> Tuple[Any, Any]:
+        numpy = self._numpy
+        distances = (self.centroids * self.centroids).sum(axis=1) - 2 * (
+            self.centroids @ query
+        )
+        if n_probe < len(self.centroids):
+            probed = numpy.argpartition(distances, n_probe)[:n_probe]
+        else:
+            probed = numpy.arange(len(self.centroids))
+        candidates = numpy.concatenate(
+            [numpy.arange(self.offsets[i], self.offsets[i + 1]) for i in probed]
+        )
+        scores = self.vectors[candidates] @ query
+        if len(scores) > k:
+            best = numpy.argpartition(scores, -k)[-k:]
+            candidates, scores = candidates[best], scores[best]
+        order = numpy.argsort(-scores, kind="stable")
+        return self.ids[candidates[order]], scores[order]
+
+    def query(
+        self, query: Any, k: int, n_probe: Optional[int] = None
+    ) -> Tuple[Any, Any]:
+        """Find the indexed vectors with approximately the highest dot products with a query vector, or with each row
+        of a query matrix.
+
+        :param query: A query vector, or a matrix of query vectors (q x dimension).
+        :param k: The number of results to return per query.
+        :param n_probe: The number of lists to search, overriding the index default.
+        :returns: The ids of the best vectors and their scores, highest first, shaped (k,) for a query vector or
+            (q, k) for a query matrix. Missing results (when the probed lists hold fewer than k vectors) have id -1
+            and score -inf.
+        """
+        numpy = self._numpy
+        if k <= 0:
+            raise ValueError(f"Invalid k: {k}. Must be positive.")
+        queries = numpy.asarray(query)
+        single = queries.ndim == 1
+        queries = numpy.atleast_2d(queries)
+        ids = numpy.full((len(queries), k), -1, dtype=numpy.int64)
+        scores = numpy.full((len(queries), k), -numpy.inf)
+        for row, vector in enumerate(queries):
+            found_ids, found_scores = self._query_one(
+                vector, k, n_probe or self.n_probe
+            )
+            ids[row, : len(found_ids)] = found_ids
+            scores[row, : len(found_scores)] = found_scores
+        if single:
+            return ids[0], scores[0]
+        return ids, scores
+
+    def save(self, path: str) -> None:
+        """Save the index in ``.npz`` format, to exactly the given path."""
+        # numpy.savez appends ".npz" to paths without it, but not to files
+        with open(path, "wb") as f:
+            self._numpy.savez(
+                f,
+                centroids=self.centroids,
+                vectors=self.vectors,
+                ids=self.ids,
+                offsets=self.offsets,
+                n_probe=self.n_probe,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Load an index saved with :meth:`save`."""
+        numpy = require_numpy()
+
+        with numpy.load(path, allow_pickle=False) as data:
+            index = cls(data["centroids"], n_probe=int(data["n_probe"]))
+            index._vectors = data["vectors"]
+            index._ids = data["ids"]
+            index._offsets = data["offsets"]
+        if len(index._ids):
+            index._next_id = int(index._ids.max()) + 1
+        return index
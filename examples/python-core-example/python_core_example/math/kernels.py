@@ -0,0 +1,91 @@
+import array
+import math
+import operator
+from typing import Any, Iterable, List, Optional, Sequence, Union
+
+from ._compat import optional_numpy, widen
+from .sparse import SparseVector, sparse_dot_product
+
+Vector = Iterable[float]
+
+
+def _supports_arrays(operand: Any) -> bool:
+    """Whether an operand can be viewed as a NumPy array without converting element by element."""
+    return isinstance(operand, (array.array, memoryview)) or hasattr(
+        operand, "__array__"
+    )
+
+
+def as_arrays(*operands: Any) -> Optional[List[Any]]:
+    """View all operands as NumPy arrays, if they all support it (NumPy arrays, ``array.array``, ``memoryview`` and
+    other objects implementing ``__array__``) and numpy is installed.
+
+    Buffer protocol inputs are viewed without copying, except that integer arrays narrower than 64 bits are promoted
+    to ``int64`` so reductions over them don't silently overflow.
+
+    :returns: The operands as arrays, or None if the generic pure Python kernels should be used instead.
+    """
+    if not all(_supports_arrays(operand) for operand in operands):
+        return None
+    numpy = optional_numpy()
+    if numpy is None:
+        return None
+    return [widen(numpy, operand) for operand in operands]
+
+
+def dot_product(vector1: Vector, vector2: Vector) -> float:
+    """Calculate the dot product of two vectors, stopping at the end of the shorter one.
+
+    Vectorized for array inputs (see :func:`as_arrays`), otherwise computed in pure Python for any iterables. When
+    either vector is a :class:`~python_core_example.math.sparse.SparseVector`, only its non-zero values are visited.
+    """
+    if isinstance(vector1, SparseVector) or isinstance(vector2, SparseVector):
+        return sparse_dot_product(vector1, vector2)
+    arrays = as_arrays(vector1, vector2)
+    if arrays is None:
+        return sum(map(operator.mul, vector1, vector2))
+    left, right = arrays
+    size = min(len(left), len(right))
+    return left[:size].dot(right[:size]).item()
+
+
+def norm(vector: Vector) -> float:
+    """Calculate the Euclidean (L2) norm of a vector."""
+    if isinstance(vector, SparseVector):
+        return math.sqrt(math.fsum(v * v for v in vector.values))
+    arrays = as_arrays(vector)
+    if arrays is None:
+        return math.sqrt(sum(i * i for i in vector))
+    (values,) = arrays
+    return math.sqrt(values.dot(values).item())
+
+
+def cosine_similarity(vector1: Vector, vector2: Vector) -> float:
+    """Calculate the cosine of the angle between two vectors, or 0 if either has no magnitude."""
+    # Generic iterables may only be consumable once
+    vector1, vector2 = (
+        vector
+        if isinstance(vector, SparseVector) or _supports_arrays(vector)
+        else list(vector)
+        for vector in (vector1, vector2)
+    )
+    magnitude = norm(vector1) * norm(vector2)
+    if not magnitude:
+        return 0.0
+    return dot_product(vector1, vector2) / magnitude
+
+
+def matrix_vector_product(
+    matrix: Union[Sequence[Vector], Any], vector: Vector
+) -> Union[List[float], Any]:
+    """Calculate the dot product of each row of a matrix with a vector.
+
+    :returns: A NumPy array when the inputs are arrays (see :func:`as_arrays`), otherwise a list.
+    """
+    arrays = as_arrays(matrix, vector)
+    if arrays is None:
+        vector = list(vector)
+        return [dot_product(row, vector) for row in matrix]
+    rows, values = arrays
+    size = min(rows.shape[-1], len(values))
+    return rows[..., :size].dot(values[:size])
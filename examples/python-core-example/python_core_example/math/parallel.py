@@ -0,0 +1,163 @@
+import concurrent.futures
+import math
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+from ._compat import require_numpy, widen
+from .kernels import Vector
+
+# Elements per task in parallel reductions. Partial sums are always taken over the same chunks, so the result doesn't
+# depend on how many workers share them
+PARALLEL_CHUNK_SIZE = 1 << 22
+
+
+class SharedVector:
+    """A 1-d NumPy array backed by a :mod:`multiprocessing.shared_memory` block.
+
+    A shared vector is pickled as just the name of its block, so vectors passed to workers - including workers started
+    with the ``spawn`` method - attach to the same memory rather than copying it. Only the process that created the
+    block unlinks it, when the vector is closed.
+
+    Note: Requires numpy to be installed.
+    """
+
+    def __init__(self, name: str, length: int, dtype: str, owner: bool = False):
+        """Attach to an existing block, see :meth:`create` to allocate a new one.
+
+        :param name: The shared memory block name.
+        :param length: The number of elements.
+        :param dtype: The NumPy dtype string of the elements.
+        :param owner: Whether to unlink the block when the vector is closed.
+        """
+        numpy = require_numpy()
+
+        self.name = name
+        self.length = length
+        self.dtype = dtype
+        self.owner = owner
+        self._memory = shared_memory.SharedMemory(name=name)
+        self.array: Optional[Any] = numpy.ndarray(
+            (length,), dtype=dtype, buffer=self._memory.buf
+        )
+
+    @classmethod
+    def create(cls, values: Vector) -> "SharedVector":
+        """Allocate a shared memory block and copy a vector into it."""
+        numpy = require_numpy()
+
+        values = numpy.ravel(numpy.asarray(values))
+        memory = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+        try:
+            numpy.copyto(
+                numpy.ndarray(values.shape, dtype=values.dtype, buffer=memory.buf),
+                values,
+            )
+            return cls(memory.name, len(values), values.dtype.str, owner=True)
+        finally:
+            memory.close()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getstate__(self):
+        return {"name": self.name, "length": self.length, "dtype": self.dtype}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], state["length"], state["dtype"])
+
+    def close(self) -> None:
+        """Detach from the block, unlinking it if this vector created it. The array can't be used afterwards."""
+        # The buffer can't be released while an array still exports it
+        self.array = None
+        self._memory.close()
+        if self.owner:
+            self._memory.unlink()
+            self.owner = False
+
+    def _attached_array(self) -> Any:
+        """Get the array, raising a ValueError if the vector was closed."""
+        if self.array is None:
+            raise ValueError(f"Shared vector {self.name} is closed")
+        return self.array
+
+    def __enter__(self) -> "SharedVector":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _as_array(vector: Any) -> Any:
+    numpy = require_numpy()
+
+    if isinstance(vector, SharedVector):
+        vector = vector._attached_array()
+    return widen(numpy, vector)
+
+
+def _dot_chunk(
+    state1: Dict[str, Any], state2: Dict[str, Any], start: int, stop: int
+) -> float:
+    """Reduce one chunk, attaching to (and detaching from) the shared vectors described by their pickled states."""
+    numpy = require_numpy()
+
+    with SharedVector(**state1) as vector1, SharedVector(**state2) as vector2:
+        chunk1 = widen(numpy, vector1._attached_array()[start:stop])
+        chunk2 = widen(numpy, vector2._attached_array()[start:stop])
+        return chunk1.dot(chunk2).item()
+
+
+def parallel_dot_product(
+    vector1: Any,
+    vector2: Any,
+    max_workers: Optional[int] = None,
+    chunk_size: int = PARALLEL_CHUNK_SIZE,
+    executor: Optional[concurrent.futures.Executor] = None,
+) -> float:
+    """Calculate the dot product of two long vectors across worker processes, stopping at the end of the shorter one.
+
+    The operands are placed in shared memory (unless they are already :class:`SharedVector` objects, which avoids
+    copying them), each worker reduces fixed size chunks of them, and the partial sums are combined with
+    :func:`math.fsum`. Since the chunks don't depend on the number of workers and ``fsum`` is exactly rounded, the
+    result is the same for any number of workers or order of completion.
+
+    Note: Requires numpy to be installed. Only worthwhile for vectors of tens of millions of elements or more, shorter
+    vectors than one chunk are reduced in the calling process.
+
+    :param vector1: The first vector, as a :class:`SharedVector` or anything ``numpy.asarray`` accepts.
+    :param vector2: The second vector.
+    :param max_workers: The number of worker processes, if no executor is provided.
+    :param chunk_size: The number of elements reduced per task.
+    :param executor: An existing executor to submit tasks to, rather than starting a new process pool.
+    :returns: The dot product.
+    """
+    length = min(len(vector1), len(vector2))
+    if length <= chunk_size:
+        return _as_array(vector1)[:length].dot(_as_array(vector2)[:length]).item()
+
+    owned: List[SharedVector] = []
+    try:
+        shared = []
+        for vector in (vector1, vector2):
+            if not isinstance(vector, SharedVector):
+                vector = SharedVector.create(vector)
+                owned.append(vector)
+            shared.append(vector)
+        if executor is None:
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers
+            ) as pool:
+                return parallel_dot_product(
+                    shared[0], shared[1], chunk_size=chunk_size, executor=pool
+                )
+        state1, state2 = (vector.__getstate__() for vector in shared)
+        futures = [
+            executor.submit(
+                _dot_chunk, state1, state2, start, min(start + chunk_size, length)
+            )
+            for start in range(0, length, chunk_size)
+        ]
+        return math.fsum(future.result() for future in futures)
+    finally:
+        for vector in owned:
+            vector.close()
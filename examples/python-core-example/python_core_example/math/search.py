@@ -0,0 +1,71 @@
+from typing import Any, Tuple
+
+from ._compat import require_numpy
+
+# Score the corpus in blocks of about this many bytes of rows, so the block and its scores stay in cache / RAM
+TOP_K_BLOCK_BYTES = 16 * 1024 * 1024
+
+
+def _top_k_rows(numpy: Any, scores: Any, k: int) -> Any:
+    """Get the column indexes of the k highest scores in each row, in no particular order."""
+    if scores.shape[1] <= k:
+        return numpy.broadcast_to(numpy.arange(scores.shape[1]), scores.shape)
+    return numpy.argpartition(scores, -k, axis=1)[:, -k:]
+
+
+def top_k_dot_products(
+    query: Any,
+    corpus: Any,
+    k: int,
+    block_bytes: int = TOP_K_BLOCK_BYTES,
+) -> Tuple[Any, Any]:
+    """Find the corpus vectors with the highest dot products with a query vector, or with each row of a query matrix.
+
+    The corpus is scored in blocks with one matrix multiply per block, and each block's best candidates are selected
+    with ``numpy.argpartition``, so only the final k results per query are ever sorted.
+
+    Note: Requires numpy to be installed.
+
+    :param query: A query vector of dimension d, or a matrix of q query vectors (q x d).
+    :param corpus: A matrix of n corpus vectors (n x d), e.g. a NumPy array or memory mapped file.
+    :param k: The number of results to return per query.
+    :param block_bytes: The approximate size of each block of corpus rows scored at once.
+    :returns: The indexes of the best corpus vectors and their scores, highest first, each shaped (k,) for a query
+        vector or (q, k) for a query matrix. Fewer than k results are returned if the corpus is smaller than k.
+    """
+    numpy = require_numpy()
+
+    queries = numpy.asarray(query)
+    single = queries.ndim == 1
+    queries = numpy.atleast_2d(queries)
+    corpus = numpy.asarray(corpus)
+    if k <= 0:
+        raise ValueError(f"Invalid k: {k}. Must be positive.")
+    if corpus.ndim != 2 or corpus.shape[1] != queries.shape[1]:
+        raise ValueError(
+            f"Corpus shape {corpus.shape} doesn't match query dimension {queries.shape[1]}"
+        )
+
+    rows_per_block = max(k, block_bytes // max(1, corpus.itemsize * corpus.shape[1]))
+    best_indexes = numpy.empty((len(queries), 0), dtype=numpy.intp)
+    best_scores = numpy.empty(
+        (len(queries), 0), dtype=numpy.result_type(queries, corpus)
+    )
+    for start in range(0, len(corpus), rows_per_block):
+        block_scores = queries @ corpus[start : start + rows_per_block].T
+        candidates = _top_k_rows(numpy, block_scores, k)
+        scores = numpy.concatenate(
+            (best_scores, numpy.take_along_axis(block_scores, candidates, axis=1)),
+            axis=1,
+        )
+        indexes = numpy.concatenate((best_indexes, candidates + start), axis=1)
+        keep = _top_k_rows(numpy, scores, k)
+        best_scores = numpy.take_along_axis(scores, keep, axis=1)
+        best_indexes = numpy.take_along_axis(indexes, keep, axis=1)
+
+    order = numpy.argsort(-best_scores, axis=1, kind="stable")
+    best_scores = numpy.take_along_axis(best_scores, order, axis=1)
+    best_indexes = numpy.take_along_axis(best_indexes, order, axis=1)
+    if single:
+        return best_indexes[0], best_scores[0]
+    return best_indexes, best_scores
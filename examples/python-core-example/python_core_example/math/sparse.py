@@ -0,0 +1,231 @@
+import array
+import bisect
+import sys
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+from ._compat import require_numpy
+
+
+class SparseVector:
+    """A sparse vector, stored as sorted arrays of the indexes of its non-zero values and the values themselves.
+
+    Dot products with other sparse vectors or dense vectors only visit the non-zero values, so their cost scales with
+    the number of non-zeros rather than the dimension. :func:`~python_core_example.math.kernels.dot_product` dispatches
+    to :meth:`dot` when either operand is sparse.
+    """
+
+    __slots__ = ("indices", "values", "dimension")
+
+    def __init__(
+        self,
+        indices: Iterable[int],
+        values: Iterable[float],
+        dimension: Optional[int] = None,
+    ):
+        """Create a sparse vector.
+
+        :param indices: The indexes of the non-zero values, in increasing order without duplicates.
+        :param values: The values at each index.
+        :param dimension: The length of the dense vector, defaulting to one past the highest index.
+        """
+        self.indices = array.array("q", indices)
+        self.values = array.array("d", values)
+        if len(self.indices) != len(self.values):
+            raise ValueError(
+                f"Got {len(self.indices)} indices for {len(self.values)} values"
+            )
+        if any(a >= b for a, b in zip(self.indices, self.indices[1:])):
+            raise ValueError("Sparse vector indices must be strictly increasing")
+        self.dimension = (
+            dimension
+            if dimension is not None
+            else (self.indices[-1] + 1 if self.indices else 0)
+        )
+
+    @classmethod
+    def from_dict(
+        cls, mapping: Mapping[int, float], dimension: Optional[int] = None
+    ) -> "SparseVector":
+        """Create a sparse vector from a mapping of index to value, dropping zeros."""
+        items = sorted((i, v) for i, v in mapping.items() if v)
+        return cls((i for i, _ in items), (v for _, v in items), dimension=dimension)
+
+    @classmethod
+    def from_dense(cls, vector: Iterable[float]) -> "SparseVector":
+        """Create a sparse vector from the non-zero values of a dense vector."""
+        items = list(enumerate(vector))
+        return cls(
+            (i for i, v in items if v), (v for _, v in items if v), dimension=len(items)
+        )
+
+    def __len__(self) -> int:
+        return self.dimension
+
+    @property
+    def nnz(self) -> int:
+        """The number of non-zero values."""
+        return len(self.indices)
+
+    def to_dict(self) -> Dict[int, float]:
+        return dict(zip(self.indices, self.values))
+
+    def to_dense(self) -> Any:
+        """Convert to a dense list of values."""
+        dense = [0.0] * self.dimension
+        for i, v in zip(self.indices, self.values):
+            dense[i] = v
+        return dense
+
+    def dot(self, other: Any) -> float:
+        """Calculate the dot product with another sparse vector or a dense vector."""
+        if isinstance(other, SparseVector):
+            return _sparse_sparse_dot(self, other)
+        return _sparse_dense_dot(self, other)
+
+
+def _sparse_sparse_dot(left: SparseVector, right: SparseVector) -> float:
+    if left.nnz > right.nnz:
+        left, right = right, left
+    if not left.nnz:
+        return 0.0
+    total = 0.0
+    if left.nnz * 8 < right.nnz:
+        # Much sparser on one side: binary search its indexes in the other
+        indices, values, size = right.indices, right.values, right.nnz
+        for i, v in zip(left.indices, left.values):
+            position = bisect.bisect_left(indices, i)
+            if position < size and indices[position] == i:
+                total += v * values[position]
+        return total
+    # Otherwise walk both sorted index arrays together
+    i = j = 0
+    left_indices, right_indices = left.indices, right.indices
+    while i < left.nnz and j < right.nnz:
+        if left_indices[i] == right_indices[j]:
+            total += left.values[i] * right.values[j]
+            i += 1
+            j += 1
+        elif left_indices[i] < right_indices[j]:
+            i += 1
+        else:
+            j += 1
+    return total
+
+
+def _sparse_dense_dot(sparse: SparseVector, dense: Any) -> float:
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(dense, numpy.ndarray):
+        indices = numpy.frombuffer(sparse.indices, dtype=numpy.int64)
+        # Stop at the end of a shorter dense vector
+        size = int(numpy.searchsorted(indices, len(dense)))
+        values = numpy.frombuffer(sparse.values, dtype=numpy.float64)
+        return dense[indices[:size]].dot(values[:size]).item() if size else 0.0
+    if not isinstance(dense, Sequence):
+        dense = list(dense)
+    size = bisect.bisect_left(sparse.indices, len(dense))
+    return sum(
+        dense[i] * v for i, v in zip(sparse.indices[:size], sparse.values[:size])
+    )
+
+
+def sparse_dot_product(vector1: Any, vector2: Any) -> float:
+    """Calculate the dot product of two vectors, at least one of which is a :class:`SparseVector`."""
+    if isinstance(vector1, SparseVector):
+        return vector1.dot(vector2)
+    return vector2.dot(vector1)
+
+
+class SparseMatrix:
+    """A batch of sparse vectors in compressed sparse row (CSR) format.
+
+    Row i's non-zero values are ``values[indptr[i]:indptr[i + 1]]`` at columns ``indices[indptr[i]:indptr[i + 1]]``.
+
+    Note: Requires numpy to be installed.
+    """
+
+    def __init__(self, indptr: Any, indices: Any, values: Any, shape: Tuple[int, int]):
+        numpy = require_numpy()
+
+        self.indptr = numpy.asarray(indptr, dtype=numpy.int64)
+        self.indices = numpy.asarray(indices, dtype=numpy.int64)
+        self.values = numpy.asarray(values, dtype=numpy.float64)
+        self.shape = shape
+
+    @classmethod
+    def from_dicts(
+        cls, rows: Sequence[Mapping[int, float]], dimension: Optional[int] = None
+    ) -> "SparseMatrix":
+        """Convert a batch of index to value mappings into a matrix, one row per mapping.
+
+        :param rows: The rows, as mappings of column index to value.
+        :param dimension: The number of columns, defaulting to one past the highest index.
+        """
+        numpy = require_numpy()
+
+        counts = numpy.fromiter(
+            (len(row) for row in rows), dtype=numpy.int64, count=len(rows)
+        )
+        indptr = numpy.concatenate(([0], numpy.cumsum(counts)))
+        total = int(indptr[-1])
+        indices = numpy.fromiter(
+            (i for row in rows for i in row.keys()), dtype=numpy.int64, count=total
+        )
+        values = numpy.fromiter(
+            (v for row in rows for v in row.values()), dtype=numpy.float64, count=total
+        )
+        # Sort columns within each row by sorting on (row, column)
+        order = numpy.lexsort((indices, numpy.repeat(numpy.arange(len(rows)), counts)))
+        indices, values = indices[order], values[order]
+        if dimension is None:
+            dimension = int(indices.max()) + 1 if total else 0
+        return cls(indptr, indices, values, (len(rows), dimension))
+
+    @classmethod
+    def from_vectors(cls, vectors: Sequence[SparseVector]) -> "SparseMatrix":
+        """Stack sparse vectors into a matrix."""
+        return cls.from_dicts(
+            [vector.to_dict() for vector in vectors],
+            dimension=max((vector.dimension for vector in vectors), default=0),
+        )
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def row(self, i: int) -> SparseVector:
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return SparseVector(
+            self.indices[start:end].tolist(),
+            self.values[start:end].tolist(),
+            dimension=self.shape[1],
+        )
+
+    def dot(self, vector: Any) -> Any:
+        """Calculate the dot product of each row with a dense vector or a :class:`SparseVector`.
+
+        :returns: A NumPy array of one score per row.
+        """
+        numpy = require_numpy()
+
+        if isinstance(vector, SparseVector):
+            # Scatter the query once, so every row is a gather of its non-zeros
+            dense = numpy.zeros(self.shape[1])
+            query_indices = numpy.frombuffer(vector.indices, dtype=numpy.int64)
+            in_range = query_indices < self.shape[1]
+            dense[query_indices[in_range]] = numpy.frombuffer(
+                vector.values, dtype=numpy.float64
+            )[in_range]
+        else:
+            dense = numpy.asarray(vector)
+            if len(dense) < self.shape[1]:
+                # Stop at the end of a shorter vector, like dot_product
+                dense = numpy.concatenate(
+                    (dense, numpy.zeros(self.shape[1] - len(dense), dense.dtype))
+                )
+        products = self.values * dense[self.indices]
+        scores = numpy.zeros(len(self))
+        non_empty = self.indptr[1:] > self.indptr[:-1]
+        if products.size:
+            scores[non_empty] = numpy.add.reduceat(
+                products, self.indptr[:-1][non_empty]
+            )
+        return scores
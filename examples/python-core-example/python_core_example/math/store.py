@@ -0,0 +1,131 @@
+import struct
+from typing import Any, Iterable, Literal, Tuple, Union
+
+from ._compat import require_numpy
+from .search import top_k_dot_products
+
+# File layout: a fixed size header, then rows of little endian float32 values
+VECTOR_STORE_MAGIC = b"PCEVECS\x00"
+VECTOR_STORE_VERSION = 1
+_HEADER_FORMAT = "<8sIIQ"  # magic, version, dimension, rows
+# Padded so rows start on a cache line boundary
+VECTOR_STORE_HEADER_SIZE = 64
+VECTOR_STORE_DTYPE = "<f4"
+
+# The numpy.memmap modes a store can be opened with
+StoreMode = Literal["r", "r+", "c"]
+
+
+def _read_header(path: str) -> Tuple[int, int]:
+    """Read the dimension and number of rows of a vector store file."""
+    with open(path, "rb") as f:
+        header = f.read(struct.calcsize(_HEADER_FORMAT))
+    if len(header) < struct.calcsize(_HEADER_FORMAT):
+        raise ValueError(f"Not a vector store file ({path}): file too short")
+    magic, version, dimension, rows = struct.unpack(_HEADER_FORMAT, header)
+    if magic != VECTOR_STORE_MAGIC:
+        raise ValueError(f"Not a vector store file ({path}): bad magic {magic!r}")
+    if version != VECTOR_STORE_VERSION:
+        raise ValueError(f"Unsupported vector store version ({path}): {version}")
+    return dimension, rows
+
+
+def _write_header(f: Any, dimension: int, rows: int) -> None:
+    f.seek(0)
+    header = struct.pack(
+        _HEADER_FORMAT, VECTOR_STORE_MAGIC, VECTOR_STORE_VERSION, dimension, rows
+    )
+    f.write(header.ljust(VECTOR_STORE_HEADER_SIZE, b"\x00"))
+
+
+class VectorStore:
+    """An on-disk store of fixed width float32 vectors, memory mapped for zero copy access.
+
+    Opening a store only reads its header, and the rows are paged in by the OS as they are used, so a store can be
+    larger than RAM. Every process that opens the same file (read only) shares the same page cache, and a store is
+    pickled as just its path, so stores passed to spawned workers are re-mapped rather than copied.
+
+    Note: Requires numpy to be installed.
+    """
+
+    def __init__(self, path: str, mode: StoreMode = "r"):
+        """Open an existing store.
+
+        :param path: The store file path.
+        :param mode: The ``numpy.memmap`` mode: ``"r"`` for read only, ``"r+"`` to modify rows in place, or ``"c"`` for
+            private copy on write.
+        """
+        numpy = require_numpy()
+
+        self.path = path
+        self.mode = mode
+        self.dimension, rows = _read_header(path)
+        # A memmap, or an in memory array for an empty store
+        self.vectors: Any
+        if rows:
+            self.vectors = numpy.memmap(
+                path,
+                dtype=VECTOR_STORE_DTYPE,
+                mode=mode,
+                offset=VECTOR_STORE_HEADER_SIZE,
+                shape=(rows, self.dimension),
+            )
+        else:
+            # Empty files can't be memory mapped
+            self.vectors = numpy.empty((0, self.dimension), dtype=VECTOR_STORE_DTYPE)
+
+    @classmethod
+    def create(
+        cls, path: str, vectors: Union[Any, Iterable[Any]], mode: StoreMode = "r"
+    ) -> "VectorStore":
+        """Write a new store, overwriting any existing file, and open it.
+
+        :param path: The store file path.
+        :param vectors: A matrix of vectors (rows x dimension), or an iterable of such matrices (or single vectors)
+            to write in batches without holding them all in memory.
+        :param mode: The mode to open the written store with, see :meth:`__init__`.
+        """
+        numpy = require_numpy()
+
+        if isinstance(vectors, numpy.ndarray):
+            vectors = [vectors]
+        dimension = None
+        rows = 0
+        with open(path, "wb") as f:
+            _write_header(f, 0, 0)
+            for batch in vectors:
+                batch = numpy.atleast_2d(numpy.asarray(batch, dtype=VECTOR_STORE_DTYPE))
+                if dimension is None:
+                    dimension = batch.shape[1]
+                elif batch.shape[1] != dimension:
+                    raise ValueError(
+                        f"Vector dimension {batch.shape[1]} doesn't match the store dimension {dimension}"
+                    )
+                f.write(numpy.ascontiguousarray(batch).tobytes())
+                rows += len(batch)
+            if dimension is None:
+                raise ValueError("Can't create a vector store without any vectors")
+            _write_header(f, dimension, rows)
+        return cls(path, mode=mode)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def __getitem__(self, index: Any) -> Any:
+        return self.vectors[index]
+
+    def __getstate__(self):
+        return {"path": self.path, "mode": self.mode}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], mode=state["mode"])
+
+    def dot_products(self, vector: Any) -> Any:
+        """Calculate the dot product of every stored vector with a vector."""
+        return self.vectors @ vector
+
+    def top_k(self, query: Any, k: int, **kwargs) -> Tuple[Any, Any]:
+        """Find the stored vectors with the highest dot products with a query, see
+        :func:`~python_core_example.math.search.top_k_dot_products`.
+        """
+        return top_k_dot_products(query, self.vectors, k, **kwargs)
@@ -0,0 +1,142 @@
+import itertools
+import math
+import mmap
+import os
+from contextlib import closing
+from typing import Any, Generator, Iterable, Iterator
+
+from ._compat import require_numpy, widen
+
+# Elements per block when streaming: large enough to amortize the per block overhead, small enough to stay in cache
+STREAM_BLOCK_SIZE = 1 << 16
+# The element type of binary files and raw buffers, which don't record their own
+STREAM_DTYPE = "<f8"
+
+
+def _read_blocks(numpy: Any, f: Any, block_size: int, dtype: Any) -> Iterator[Any]:
+    """Read blocks from a binary file into one reused buffer."""
+    buffer = numpy.empty(block_size, dtype=dtype)
+    view = memoryview(buffer.view(numpy.uint8))
+    while True:
+        filled = 0
+        while filled < len(view):
+            read = f.readinto(view[filled:])
+            if not read:
+                break
+            filled += read
+        if filled % buffer.itemsize:
+            raise ValueError(
+                f"File ends with a partial value: {filled % buffer.itemsize} trailing bytes"
+            )
+        if filled:
+            yield buffer[: filled // buffer.itemsize]
+        if filled < len(view):
+            return
+
+
+def _iterable_blocks(
+    numpy: Any, values: Iterable[Any], block_size: int, dtype: Any
+) -> Iterator[Any]:
+    """Group an iterable of numbers, or of arrays of any length, into blocks."""
+    iterator = iter(values)
+    first = next(iterator, None)
+    if first is None:
+        return
+    iterator = itertools.chain([first], iterator)
+    if numpy.ndim(first) == 0:
+        while True:
+            block = numpy.fromiter(itertools.islice(iterator, block_size), dtype=dtype)
+            if len(block):
+                yield block
+            if len(block) < block_size:
+                return
+
+    pending = []
+    size = 0
+    for piece in iterator:
+        piece = numpy.ravel(numpy.asarray(piece))
+        pending.append(piece)
+        size += len(piece)
+        while size >= block_size:
+            joined = numpy.concatenate(pending) if len(pending) > 1 else pending[0]
+            yield joined[:block_size]
+            rest = joined[block_size:]
+            pending = [rest] if len(rest) else []
+            size = len(rest)
+    if size:
+        yield numpy.concatenate(pending)
+
+
+def iter_blocks(
+    source: Any, block_size: int = STREAM_BLOCK_SIZE, dtype: Any = STREAM_DTYPE
+) -> Generator[Any, None, None]:
+    """Stream a vector as NumPy arrays of ``block_size`` elements (the last block may be shorter).
+
+    Only one block (plus at most one piece of a source yielding arrays) is held in memory at a time, so the source can
+    be larger than RAM.
+
+    Note: Requires numpy to be installed. Blocks read from files reuse the same buffer, so each block is only valid
+    until the next one is read.
+
+    :param source: One of:
+
+        - A NumPy array or memmap, streamed as views of its flattened values.
+        - A file path, or a binary file object with ``readinto``, of raw values of type ``dtype``.
+        - A ``bytes``, ``bytearray`` or ``mmap.mmap`` buffer of raw values of type ``dtype``.
+        - Any other iterable, e.g. a generator, of numbers or of arrays of any length.
+    :param block_size: The number of elements per block.
+    :param dtype: The element type of files, raw buffers and iterables of numbers.
+    :returns: An iterator of blocks.
+    """
+    numpy = require_numpy()
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from _read_blocks(numpy, f, block_size, dtype)
+        return
+    if hasattr(source, "readinto"):
+        yield from _read_blocks(numpy, source, block_size, dtype)
+        return
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        source = numpy.frombuffer(source, dtype=dtype)
+    if isinstance(source, (numpy.ndarray, memoryview)):
+        values = numpy.asarray(source).reshape(-1)
+        for start in range(0, len(values), block_size):
+            yield values[start : start + block_size]
+        return
+    yield from _iterable_blocks(numpy, source, block_size, dtype)
+
+
+def streaming_dot_product(
+    vector1: Any,
+    vector2: Any,
+    block_size: int = STREAM_BLOCK_SIZE,
+    dtype: Any = STREAM_DTYPE,
+) -> float:
+    """Calculate the dot product of two vectors streamed in blocks, stopping at the end of the shorter one.
+
+    Each pair of blocks is reduced with one vectorized dot product, so memory use is bounded by the block size and
+    files are read at close to disk bandwidth. The partial sums are combined with :func:`math.fsum`.
+
+    Note: Requires numpy to be installed.
+
+    :param vector1: The first vector, as any source accepted by :func:`iter_blocks`.
+    :param vector2: The second vector.
+    :param block_size: The number of elements per block.
+    :param dtype: The element type of files, raw buffers and iterables of numbers.
+    :returns: The dot product.
+    """
+    numpy = require_numpy()
+
+    partials = []
+    with closing(iter_blocks(vector1, block_size, dtype)) as blocks1, closing(
+        iter_blocks(vector2, block_size, dtype)
+    ) as blocks2:
+        for block1, block2 in zip(blocks1, blocks2):
+            length = min(len(block1), len(block2))
+            partials.append(
+                widen(numpy, block1[:length]).dot(widen(numpy, block2[:length])).item()
+            )
+            if length < block_size:
+                break
+    return math.fsum(partials)
@@ -0,0 +1,273 @@
+import array
+import collections
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import FrameType
+from typing import Counter, Dict, List, Optional, Tuple, Union
+
+from .time_helpers import timestamp_millis
+
+logger = logging.getLogger(__name__)
+
+# How often in-flight slow calls have their stack sampled
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Number of recent durations per call name used to estimate a running percentile threshold
+PROFILE_WINDOW = 1_000
+# Don't profile against a running percentile until it's based on this many calls
+PROFILE_MIN_CALLS = 100
+# Recompute running percentile thresholds every this many calls
+PROFILE_REFRESH_CALLS = 100
+# Frames stored per traced allocation, more frames make tracemalloc slower without improving the totals
+ALLOCATION_TRACE_FRAMES = 1
+
+ProfileThreshold = Union[float, str]
+
+
+def parse_profile_threshold(threshold: ProfileThreshold) -> Union[float, str]:
+    """Validate a profile threshold: either seconds, or a running percentile of the call's own durations like ``"p99"``.
+
+    :returns: The threshold in seconds, or the normalized percentile string.
+    :raises: A ValueError if the threshold can't be parsed.
+    """
+    if isinstance(threshold, str):
+        match = re.fullmatch(r"p(\d+(\.\d+)?)", threshold.strip().lower())
+        if not match or not 0 < float(match.group(1)) < 100:
+            raise ValueError(
+                f"Invalid profile threshold: {threshold}. Expected seconds or a percentile like 'p99'."
+            )
+        return f"p{match.group(1)}"
+    if threshold < 0:
+        raise ValueError(f"Invalid profile threshold: {threshold}. Must be positive.")
+    return float(threshold)
+
+
+def _fold(frame: Optional[FrameType]) -> str:
+    """Convert a stack to a single line in collapsed stack format, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ProfiledCall:
+    """A call in flight, sampled by the profiler once it runs past its deadline."""
+
+    __slots__ = ("name", "thread_ident", "deadline", "stacks")
+
+    def __init__(self, name: str, deadline: float):
+        self.name = name
+        self.thread_ident = threading.get_ident()
+        self.deadline = deadline
+        self.stacks: Counter[str] = collections.Counter()
+
+
+class SlowCallProfiler:
+    """Captures stack profiles of individual calls that run longer than a threshold.
+
+    Calls register themselves when they start. A single background thread samples the stack of any call still running
+    past its threshold, so only the slow part of slow calls pays for profiling. When a sampled call finishes, its
+    stacks are written to ``<directory>/<call name>-<timestamp millis>.folded`` in collapsed stack format, which can be
+    opened with speedscope or ``flamegraph.pl``.
+
+    Only synchronous calls can be profiled: a suspended coroutine's thread runs the event loop and other tasks, so its
+    stack isn't the call's.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        sample_interval: float = PROFILE_SAMPLE_INTERVAL,
+    ):
+        """Create a profiler.
+
+        :param directory: The directory to write profiles to, defaulting to the PROFILE_DIR environment variable
+            or the system temp directory.
+        :param sample_interval: Seconds between stack samples of slow calls.
+        """
+        self.directory = (
+            directory or os.environ.get("PROFILE_DIR") or tempfile.gettempdir()
+        )
+        self.sample_interval = sample_interval
+        self._in_flight: Dict[int, ProfiledCall] = {}
+        self._durations: Dict[str, array.array] = {}
+        self._counts: Dict[str, int] = collections.defaultdict(int)
+        self._thresholds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def observe(self, name: str, duration: float, threshold: Union[float, str]) -> None:
+        """Track a call duration to maintain the running percentile threshold for the call name, if it uses one."""
+        if not isinstance(threshold, str):
+            return
+        percentile = float(threshold[1:])
+        durations = self._durations.get(name)
+        if durations is None:
+            durations = self._durations.setdefault(name, array.array("d"))
+        count = self._counts[name] = self._counts[name] + 1
+        if len(durations) < PROFILE_WINDOW:
+            durations.append(duration)
+        else:
+            durations[count % PROFILE_WINDOW] = duration
+        if count >= PROFILE_MIN_CALLS and count % PROFILE_REFRESH_CALLS == 0:
+            ordered = sorted(durations)
+            self._thresholds[name] = ordered[
+                min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+            ]
+
+    def threshold(self, name: str, threshold: Union[float, str]) -> Optional[float]:
+        """Get the threshold in seconds for a call, or None if a running percentile isn't known yet."""
+        if isinstance(threshold, str):
+            return self._thresholds.get(name)
+        return threshold
+
+    def start(self, name: str, threshold: Union[float, str]) -> Optional[ProfiledCall]:
+        """Register a call that is starting, to be sampled if it runs past its threshold.
+
+        :param name: The call name.
+        :param threshold: The parsed threshold, see :func:`parse_profile_threshold`.
+        :returns: The call to pass to :meth:`finish`, or None if no threshold is known for the call yet.
+        """
+        limit = self.threshold(name, threshold)
+        if limit is None:
+            return None
+        call = ProfiledCall(name, time.perf_counter() + limit)
+        self._in_flight[id(call)] = call
+        if self._sampler is None:
+            self._start_sampler()
+        return call
+
+    def finish(self, call: ProfiledCall, duration: float) -> Optional[str]:
+        """Unregister a finished call, writing its profile if it was sampled.
+
+        :returns: The path of the written profile, if any.
+        """
+        self._in_flight.pop(id(call), None)
+        # The sampler may be adding a sample to the call right now
+        with self._lock:
+            stacks = collections.Counter(call.stacks)
+        if not stacks:
+            return None
+        path = self._write(call.name, stacks)
+        logger.info(
+            r"SLOW_CALL_PROFILE - {\"method\": \"%s\", \"duration\": %.2f, \"profile\": \"%s\"}",
+            call.name,
+            duration,
+            path,
+        )
+        return path
+
+    def _write(self, name: str, stacks: Counter[str]) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        path = os.path.join(self.directory, f"{safe_name}-{timestamp_millis()}.folded")
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _start_sampler(self) -> None:
+        with self._lock:
+            if self._sampler is not None:
+                return
+            self._sampler = threading.Thread(
+                target=self._sample_forever, name="SlowCallProfiler", daemon=True
+            )
+            self._sampler.start()
+
+    def sample(self) -> None:
+        """Sample the stacks of all in-flight calls that are past their deadline."""
+        now = time.perf_counter()
+        frames = None
+        for call in list(self._in_flight.values()):
+            if now < call.deadline:
+                continue
+            if frames is None:
+                frames = sys._current_frames()
+            frame = frames.get(call.thread_ident)
+            if frame is not None:
+                stack = _fold(frame)
+                with self._lock:
+                    call.stacks[stack] += 1
+
+    def _sample_forever(self) -> None:  # pragma: nocover
+        # Runs in a background thread, sample() is tested directly
+        while True:
+            time.sleep(self.sample_interval)
+            if self._in_flight:
+                self.sample()
+
+
+slow_call_profiler = SlowCallProfiler()
+
+
+class AllocationMeasurement:
+    """The traced memory at the start of a call, and the highest traced memory seen since."""
+
+    __slots__ = ("start", "peak")
+
+    def __init__(self, start: int):
+        self.start = start
+        self.peak = start
+
+
+class AllocationTracker:
+    """Measures the peak and net bytes allocated during calls with :mod:`tracemalloc`.
+
+    Tracing is only started while at least one measurement is active (unless it was already started elsewhere), so
+    sampling a fraction of calls bounds the overhead to the sampled calls. Traced memory is process wide, so calls
+    running concurrently in other threads or asyncio tasks are included in a call's measurement.
+
+    Note: Peak measurements require Python 3.9+ (``tracemalloc.reset_peak``). Earlier versions report the larger of
+    the start and end traced memory as the peak.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: List[AllocationMeasurement] = []
+        self._started = False
+        self._reset_peak = getattr(tracemalloc, "reset_peak", None)
+
+    def start(self) -> AllocationMeasurement:
+        """Start measuring allocations, starting tracing if needed."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(ALLOCATION_TRACE_FRAMES)
+                self._started = True
+            current, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak would hide it from enclosing measurements, so fold it into them first
+            for measurement in self._active:
+                measurement.peak = max(measurement.peak, peak)
+            if self._reset_peak is not None:
+                self._reset_peak()
+            measurement = AllocationMeasurement(current)
+            self._active.append(measurement)
+        return measurement
+
+    def finish(self, measurement: AllocationMeasurement) -> Tuple[int, int]:
+        """Finish a measurement, stopping tracing if it's the last active one and tracing was started here.
+
+        :returns: The net bytes allocated (negative if freed) and the peak bytes allocated above the starting point.
+        """
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._reset_peak is None:
+                peak = current
+            measurement.peak = max(measurement.peak, peak)
+            self._active.remove(measurement)
+            if not self._active and self._started:
+                tracemalloc.stop()
+                self._started = False
+        return current - measurement.start, measurement.peak - measurement.start
+
+
+allocation_tracker = AllocationTracker()
@@ -0,0 +1,122 @@
+import fcntl
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Mapping, Optional
+from urllib.parse import urlsplit
+
+# The default directory of rate limiter state files, shared by every process on the machine
+RATE_LIMIT_DIR = os.path.join(tempfile.gettempdir(), "python_core_example-rate-limits")
+# Each state file holds the time the latest reservation is scheduled for, as a double
+_STATE_FORMAT = "<d"
+
+
+class RateLimiter:
+    """Per host rate limits shared by every thread and local process, including workers started with ``spawn``.
+
+    Each host has a token bucket of ``burst`` requests refilled at ``rate`` requests per second, implemented by
+    scheduling requests one interval apart (the generic cell rate algorithm). Each request reserves the next slot and
+    waits for it, so once the burst is spent requests are spaced evenly at the rate rather than sent in bursts that then
+    back off. The reservation time of each host is kept in a small file, locked with ``flock`` while it's updated, so
+    every process using the same directory shares the limit. A limiter is pickled as its settings, so limiters passed
+    to workers reopen the same files.
+
+    Note: Requires a POSIX system, for ``fcntl.flock``.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float = 1,
+        host_rates: Optional[Mapping[str, float]] = None,
+        directory: Optional[str] = None,
+    ):
+        """Create a limiter.
+
+        :param rate: The requests per second allowed to each host.
+        :param burst: The requests allowed to a host at once after it has been idle.
+        :param host_rates: Requests per second allowed to specific hosts, overriding ``rate``.
+        :param directory: The directory of the state files, defaulting to the RATE_LIMIT_DIR environment variable or a
+            directory in the system temp directory. Processes share limits when they use the same directory.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = dict(host_rates or {})
+        self.directory = directory or os.environ.get("RATE_LIMIT_DIR") or RATE_LIMIT_DIR
+        self._lock = threading.Lock()
+        self._files: Dict[str, int] = {}
+        self._pid = os.getpid()
+
+    def __getstate__(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "host_rates": self.host_rates,
+            "directory": self.directory,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _file(self, host: str) -> int:
+        if self._pid != os.getpid():
+            # A forked child shares the parent's open files, and so its locks, so reopen them
+            self._files = {}
+            self._pid = os.getpid()
+        fd = self._files.get(host)
+        if fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            safe_name = re.sub(r"[^\w.-]", "_", host)
+            fd = os.open(
+                os.path.join(self.directory, f"{safe_name}.rate"),
+                os.O_RDWR | os.O_CREAT,
+                0o666,
+            )
+            self._files[host] = fd
+        return fd
+
+    def reserve(self, url: str) -> float:
+        """Reserve the next request slot for a URL's host, without waiting for it.
+
+        :param url: The request URL, or just its host.
+        :returns: The seconds to wait before sending the request.
+        """
+        host = urlsplit(url).netloc or url
+        interval = 1 / self.host_rates.get(host, self.rate)
+        with self._lock:
+            fd = self._file(host)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                state = os.pread(fd, struct.calcsize(_STATE_FORMAT), 0)
+                now = time.time()
+                scheduled = now
+                if len(state) == struct.calcsize(_STATE_FORMAT):
+                    (scheduled,) = struct.unpack(_STATE_FORMAT, state)
+                # Requests are scheduled one interval apart, but may start up to a burst ahead of their schedule
+                scheduled = max(scheduled, now) + interval
+                start = max(now, scheduled - self.burst * interval)
+                os.pwrite(fd, struct.pack(_STATE_FORMAT, scheduled), 0)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        return start - now
+
+    def acquire(self, url: str) -> float:
+        """Wait until a request to a URL's host is allowed.
+
+        :param url: The request URL, or just its host.
+        :returns: The seconds waited.
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def close(self) -> None:
+        """Close the state files."""
+        with self._lock:
+            for fd in self._files.values():
+                os.close(fd)
+            self._files = {}
@@ -1,14 +1,72 @@
+import asyncio
+import collections
+import concurrent.futures
+import copy
+import email.utils
 import logging
-from typing import Dict, Optional, Tuple, Type
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+from urllib.parse import urlsplit
 
 import requests
+import requests.adapters
 import requests.exceptions
-import retry
 import urllib3.exceptions
 
-from .common import time_api
+from .common import shared_session, time_api
+from .http_cache import ResponseCache
+
+if TYPE_CHECKING:  # pragma: nocover
+    import aiohttp
+
+    from .rate_limit import RateLimiter
 
-SLEEPTIME = 90
+# The shortest delay before a retry. Later retries wait a random time between this and BACKOFF times the previous delay
+SLEEPTIME = 2
+BACKOFF = 3
+# Statuses whose Retry-After header is honored
+RETRY_AFTER_CODES = (429, 503)
+# Each request earns this fraction of a retry in the process wide retry budget
+RETRY_BUDGET_RATIO = 0.2
+# Retries the budget allows per second regardless of traffic, so processes making few requests can still retry
+RETRY_BUDGET_MIN_PER_SECOND = 1.0
+# The most retries the budget saves up for a burst of failures
+RETRY_BUDGET_MAX_TOKENS = 10.0
+# A host's circuit opens when at least this fraction of its recent requests failed with retryable errors
+CIRCUIT_FAILURE_RATE = 0.5
+# Over a sliding window of this many seconds
+CIRCUIT_WINDOW = 30
+# Provided there were at least this many requests in the window
+CIRCUIT_MIN_REQUESTS = 10
+# Seconds an open circuit rejects requests before letting probe requests through
+CIRCUIT_OPEN_TIME = 30.0
+# Successful probe requests needed to close a half-open circuit, also the number allowed in flight at once
+CIRCUIT_PROBES = 1
+# Default cap on the requests an async_request_with_retry function has in flight at once, per event loop
+ASYNC_MAX_IN_FLIGHT = 100
+# Connections kept open by an async_session, across all hosts
+ASYNC_POOL_SIZE = 100
+# Requests read ahead of those in flight by request_many, per worker, to find requests for hosts below their cap
+REQUEST_MANY_LOOKAHEAD = 10
 
 RETRYABLE_ERROR_CODES = (429, 560, 502, 503, 500)
 RETRYABLE_ERROR_MESSAGES = (
@@ -29,9 +87,431 @@ RETRYABLE_EXCEPTIONS = (
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 class RetryableError(Exception):
     """An exception indicating a retryable HTTP error."""
 
+    def __init__(self, *args, retry_after: Optional[float] = None):
+        """Create an error.
+
+        :param retry_after: The seconds the server asked to wait before retrying, if it did.
+        """
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(RetryableError):
+    """An exception indicating a request was rejected without being sent, because its host's circuit is open.
+
+    Not retried by :func:`request_with_retry`, since the host is known to be failing. ``retry_after`` is the time until
+    the circuit lets a probe request through.
+    """
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header, either seconds or an HTTP date, into seconds from now."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+class RetryBudget:
+    """A token bucket limiting retries to a fraction of requests.
+
+    Every request deposits ``ratio`` tokens and every retry withdraws one, so during an outage retries add at most
+    ``ratio`` times the normal load instead of multiplying it by the number of tries. A trickle of ``min_per_second``
+    tokens keeps retries available to processes making few requests. Thread safe, and shared by default by every
+    :func:`request_with_retry` and :func:`async_request_with_retry` function in the process.
+    """
+
+    def __init__(
+        self,
+        ratio: float = RETRY_BUDGET_RATIO,
+        min_per_second: float = RETRY_BUDGET_MIN_PER_SECOND,
+        max_tokens: float = RETRY_BUDGET_MAX_TOKENS,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        """The retries currently available."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_tokens,
+            self._tokens + (now - self._updated) * self.min_per_second,
+        )
+        self._updated = now
+
+    def record_request(self) -> None:
+        """Deposit the share of a retry earned by a request."""
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_retry(self) -> bool:
+        """Withdraw a retry, if one is available."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+retry_budget = RetryBudget()
+
+
+class _Circuit:
+    """The state of one host's circuit."""
+
+    __slots__ = (
+        "state",
+        "buckets",
+        "requests",
+        "failures",
+        "opened",
+        "probes",
+        "successes",
+    )
+
+    def __init__(self):
+        self.state = "closed"
+        # Counts of requests and failures per second of the window, oldest first: [second, requests, failures]
+        self.buckets: Deque[List[int]] = collections.deque()
+        self.requests = 0
+        self.failures = 0
+        self.opened = 0.0
+        self.probes = 0
+        self.successes = 0
+
+
+class CircuitBreaker:
+    """Per host circuit breakers, so requests to a host that keeps failing fail fast instead of retrying.
+
+    Each host's circuit starts closed, letting every request through and counting the retryable failures
+    (:class:`RetryableError`) in a sliding window. Once the failure rate reaches ``failure_rate`` the circuit opens, and
+    requests are rejected with a :class:`CircuitOpenError` without being sent. After ``open_time`` seconds the circuit
+    is half-open: up to ``probes`` requests are let through at a time, closing the circuit once that many succeed or
+    reopening it on any failure. Other errors, like non-retryable statuses, show the host is responding and count as
+    successes. Requests that are cancelled or interrupted count as neither. Thread safe, and usable from asyncio code.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        window: int = CIRCUIT_WINDOW,
+        min_requests: int = CIRCUIT_MIN_REQUESTS,
+        open_time: float = CIRCUIT_OPEN_TIME,
+        probes: int = CIRCUIT_PROBES,
+    ):
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.open_time = open_time
+        self.probes = probes
+        self._circuits: Dict[str, _Circuit] = collections.defaultdict(_Circuit)
+        self._lock = threading.Lock()
+
+    def state(self, host: str) -> str:
+        """Get the state of a host's circuit: ``"closed"``, ``"open"`` or ``"half-open"``."""
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None:
+                return "closed"
+            if (
+                circuit.state == "open"
+                and time.monotonic() >= circuit.opened + self.open_time
+            ):
+                return "half-open"
+            return circuit.state
+
+    def _before(self, host: str) -> _Circuit:
+        with self._lock:
+            circuit = self._circuits[host]
+            if circuit.state == "closed":
+                return circuit
+            now = time.monotonic()
+            if circuit.state == "open":
+                remaining = circuit.opened + self.open_time - now
+                if remaining > 0:
+                    raise CircuitOpenError(
+                        f"Circuit open for host ({host}), retry in {remaining:.1f}s",
+                        retry_after=remaining,
+                    )
+                circuit.state = "half-open"
+                circuit.probes = circuit.successes = 0
+            if circuit.probes >= self.probes:
+                raise CircuitOpenError(
+                    f"Circuit half-open for host ({host}), waiting on probe requests",
+                    retry_after=0.0,
+                )
+            circuit.probes += 1
+            return circuit
+
+    def _after(self, host: str, circuit: _Circuit, failed: bool) -> None:
+        with self._lock:
+            if circuit.state == "half-open":
+                circuit.probes -= 1
+                if failed:
+                    self._open(host, circuit, "probe request failed")
+                    return
+                circuit.successes += 1
+                if circuit.successes >= self.probes:
+                    logger.warning("Circuit closed for host (%s)", host)
+                    circuit.state = "closed"
+                    circuit.buckets.clear()
+                    circuit.requests = circuit.failures = 0
+                return
+            if circuit.state != "closed":
+                # Finished after another request opened the circuit
+                return
+            second = int(time.monotonic())
+            while circuit.buckets and circuit.buckets[0][0] <= second - self.window:
+                _, requests_, failures = circuit.buckets.popleft()
+                circuit.requests -= requests_
+                circuit.failures -= failures
+            if not circuit.buckets or circuit.buckets[-1][0] != second:
+                circuit.buckets.append([second, 0, 0])
+            circuit.buckets[-1][1] += 1
+            circuit.buckets[-1][2] += failed
+            circuit.requests += 1
+            circuit.failures += failed
+            if (
+                failed
+                and circuit.requests >= self.min_requests
+                and circuit.failures >= self.failure_rate * circuit.requests
+            ):
+                self._open(
+                    host,
+                    circuit,
+                    f"{circuit.failures} of {circuit.requests} requests failed",
+                )
+
+    def _release(self, circuit: _Circuit) -> None:
+        with self._lock:
+            if circuit.state == "half-open":
+                circuit.probes -= 1
+
+    def _open(self, host: str, circuit: _Circuit, reason: str) -> None:
+        logger.warning(
+            "Circuit opened for host (%s) for %ss: %s", host, self.open_time, reason
+        )
+        circuit.state = "open"
+        circuit.opened = time.monotonic()
+
+    @contextmanager
+    def guard(self, url: str) -> Iterator[None]:
+        """A context manager wrapping one request to a URL, tracking its outcome for the URL's host.
+
+        :raises: A CircuitOpenError on entering if the host's circuit is open, or half-open with all probe requests
+            in flight.
+        """
+        host = urlsplit(url).netloc
+        circuit = self._before(host)
+        try:
+            yield
+        except RetryableError:
+            self._after(host, circuit, True)
+            raise
+        except Exception:
+            self._after(host, circuit, False)
+            raise
+        except BaseException:
+            # Cancelled or interrupted, so there's no outcome to count, only a probe slot to free
+            self._release(circuit)
+            raise
+        self._after(host, circuit, False)
+
+
+circuit_breaker = CircuitBreaker()
+
+
+class _Flight:
+    """A call in progress, and its outcome once it finishes."""
+
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+def _copy_error(error: BaseException) -> Optional[BaseException]:
+    """Copy an exception with its arguments and attributes, but not its traceback, or None if it can't be copied."""
+    try:
+        return copy.copy(error)
+    except Exception:
+        pass
+    # Copying calls the constructor with the exception's args, which fails if its signature differs
+    try:
+        clone = type(error).__new__(type(error), *error.args)
+        clone.__dict__.update(error.__dict__)
+        return clone
+    except Exception:
+        return None
+
+
+class SingleFlight:
+    """Collapses concurrent identical calls into one, sharing its outcome with every caller.
+
+    The first caller with a key runs the call. Callers with the same key arriving before it finishes wait for it, and
+    get the same result object, so they should treat shared results as read only. If the call fails, each waiter
+    raises its own copy of the exception, chained to the original, so tracebacks from different threads aren't mixed
+    together. Calls arriving after it finishes start a new call. Thread safe.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Any, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Any, fn: Callable[[], Any]) -> Any:
+        """Call ``fn``, or wait for an identical call already in progress.
+
+        :param key: A hashable key identifying identical calls.
+        :param fn: The call to make.
+        :returns: The result of the call.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                error = _copy_error(flight.error)
+                if error is None:
+                    raise flight.error
+                raise error from flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            if flight.waiters:
+                logger.debug(
+                    "Shared call (%s) with %s waiting callers", key, flight.waiters
+                )
+            flight.done.set()
+
+
+single_flight = SingleFlight()
+
+
+class _Backoff:
+    """The retry schedule of one request: decorrelated jitter, honoring Retry-After, within a retry budget."""
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        sleep_time: float,
+        backoff: float,
+        max_delay: float,
+        max_tries: int,
+        budget: Optional[RetryBudget],
+    ):
+        self.logger = logger
+        self.sleep_time = sleep_time
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.tries = max_tries
+        self.delay = sleep_time
+        self.budget = budget
+        if budget is not None:
+            budget.record_request()
+
+    def next_delay(self, error: RetryableError) -> Optional[float]:
+        """Get the seconds to wait before retrying after an error, or None to give up."""
+        if isinstance(error, CircuitOpenError):
+            return None
+        self.tries -= 1
+        if not self.tries:
+            return None
+        # Randomizing the whole range keeps callers that failed together from retrying together
+        delay = min(
+            self.max_delay, random.uniform(self.sleep_time, self.delay * self.backoff)
+        )
+        if error.retry_after is not None:
+            if error.retry_after > self.max_delay:
+                self.logger.warning(
+                    "%s, not retrying, server asked to wait %s seconds",
+                    error,
+                    error.retry_after,
+                )
+                return None
+            delay = max(delay, error.retry_after)
+        if self.budget is not None and not self.budget.try_retry():
+            self.logger.warning("%s, not retrying, retry budget exhausted", error)
+            return None
+        self.delay = delay
+        self.logger.warning("%s, retrying in %s seconds...", error, delay)
+        return delay
+
+
+def _is_conditional(headers: Optional[Mapping[str, str]]) -> bool:
+    """Whether request headers make it conditional, so a 304 Not Modified response is a success."""
+    return any(
+        name.lower() in ("if-none-match", "if-modified-since") for name in headers or ()
+    )
+
+
+def _check_response(
+    url: str,
+    status_code: int,
+    text: str,
+    headers: Mapping[str, str],
+    retryable_error_messages: Tuple[str, ...],
+    retryable_error_codes: Tuple[int, ...],
+    raise_exception_on_faiure_status: bool,
+) -> None:
+    """Raise a RetryableError for a retryable response, or a RuntimeError for any other failure if requested."""
+    if status_code == 200:
+        return
+    if status_code in retryable_error_codes:
+        raise RetryableError(
+            f"Encountered retryable backoff request from request ({url}): {status_code}. Response: {text}",
+            retry_after=(
+                _parse_retry_after(headers.get("Retry-After"))
+                if status_code in RETRY_AFTER_CODES
+                else None
+            ),
+        )
+    text_lowercase = text.lower()
+    if any(i in text_lowercase for i in retryable_error_messages):
+        raise RetryableError(
+            f"Encountered an error messages that looks retryable for request ({url}): {status_code}. Message: {text}"
+        )
+    if raise_exception_on_faiure_status:
+        raise RuntimeError(f"Invalid response code: {status_code}. Response: {text}")
+
 
 def request_with_retry(
     logger: logging.Logger,
@@ -39,20 +519,78 @@ def request_with_retry(
     retryable_error_messages: Tuple[str, ...] = RETRYABLE_ERROR_MESSAGES,
     retryable_error_codes: Tuple[int, ...] = RETRYABLE_ERROR_CODES,
     sleep_time: float = SLEEPTIME,
-    backoff: float = 1.25,
+    backoff: float = BACKOFF,
     max_delay: float = 60 * 5,
     max_tries: int = 5,
     raise_exception_on_faiure_status: bool = True,
+    budget: Optional[RetryBudget] = retry_budget,
+    breaker: Optional[CircuitBreaker] = None,
+    rate_limiter: Optional["RateLimiter"] = None,
+    cache: Optional[ResponseCache] = None,
+    coalesce: Optional[SingleFlight] = None,
 ):
-    @retry.retry(
-        exceptions=RetryableError,
-        backoff=backoff,
-        delay=sleep_time,
-        max_delay=max_delay,
-        tries=max_tries,
-        logger=logger,
-    )
+    """Create a function making requests, retrying retryable failures.
+
+    Retries wait a random time between ``sleep_time`` and ``backoff`` times the previous wait ("decorrelated
+    jitter"), capped at ``max_delay``, or longer if a 429 or 503 response's Retry-After header asks for it (giving up
+    if it asks for more than ``max_delay``). Retries also stop early once the retry budget is exhausted.
+
+    :param budget: The retry budget to draw retries from, defaulting to the process wide ``retry_budget``. None
+        disables the budget.
+    :param breaker: The circuit breaker to check each attempt with, e.g. the process wide ``circuit_breaker``. Requests
+        to a host with an open circuit fail immediately with a :class:`CircuitOpenError`, without retrying.
+    :param rate_limiter: The rate limiter to wait on before each attempt, see
+        :class:`~python_core_example.rate_limit.RateLimiter`.
+    :param cache: The cache to get GET responses through, except streamed ones, see
+        :class:`~python_core_example.http_cache.ResponseCache`.
+    :param coalesce: The :class:`SingleFlight` to collapse concurrent identical GET and HEAD requests (same session,
+        URL, params, headers and proxies, not streamed) with, e.g. the process wide ``single_flight``. Every caller
+        gets the outcome of one request, including its retries: the same response object, or the same exception.
+    :returns: A function taking the session, url and request options, returning the response.
+    """
+    if max_tries < 1:
+        raise ValueError(f"Invalid max_tries: {max_tries}. Must be positive.")
+
     @time_api
+    def _attempt(
+        session: requests.Session,
+        url: str,
+        method: str,
+        stream: bool,
+        headers: Optional[Mapping[str, str]],
+        proxies: Optional[Dict],
+        params: Optional[Dict],
+    ) -> requests.Response:
+        with breaker.guard(url) if breaker is not None else nullcontext():
+            if rate_limiter is not None:
+                rate_limiter.acquire(url)
+            try:
+                logger.debug("Running request for url (%s).", url)
+                resp = session.request(
+                    method,
+                    url,
+                    headers=headers,
+                    proxies=proxies,
+                    stream=stream,
+                    params=params,
+                )
+            except retryable_exceptions as e:
+                raise RetryableError(
+                    f"Encountered retryable exception in request ({url}): {e}"
+                )
+            if resp.status_code == 304 and _is_conditional(headers):
+                return resp
+            _check_response(
+                url,
+                resp.status_code,
+                resp.text,
+                resp.headers,
+                retryable_error_messages,
+                retryable_error_codes,
+                raise_exception_on_faiure_status,
+            )
+            return resp
+
     def _request_with_retry(
         session: requests.Session,
         url: str,
@@ -62,35 +600,344 @@ def request_with_retry(
         proxies: Optional[Dict] = None,
         params: Optional[Dict] = None,
     ) -> requests.Response:
-        try:
-            logger.debug("Running request for url (%s).", url)
-            resp = session.request(
-                method,
-                url,
-                headers=headers,
-                proxies=proxies,
-                stream=stream,
-                params=params,
-            )
-        except retryable_exceptions as e:
-            raise RetryableError(
-                f"Encountered retryable exception in request ({url}): {e}"
-            )
-        if resp.status_code == 200:
-            return resp
-        if resp.status_code in retryable_error_codes:
-            raise RetryableError(
-                f"Encountered retryable backoff request from request ({url}): {resp.status_code}. Response: {resp.text}"
+        def _send(request_headers: Optional[Mapping[str, str]]) -> requests.Response:
+            schedule = _Backoff(
+                logger, sleep_time, backoff, max_delay, max_tries, budget
             )
-        text_lowercase = resp.text.lower()
-        if any(i in text_lowercase for i in retryable_error_messages):
-            raise RetryableError(
-                f"Encountered an error messages that looks retryable for request ({url}): {resp.status_code}. Message: {resp.text}"
+            while True:
+                try:
+                    return _attempt(
+                        session, url, method, stream, request_headers, proxies, params
+                    )
+                except RetryableError as e:
+                    delay = schedule.next_delay(e)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+
+        def _fetch() -> requests.Response:
+            if cache is None or stream:
+                return _send(headers)
+            return cache.fetch(method, url, params, headers, _send, session)
+
+        if coalesce is None or stream or method.upper() not in ("GET", "HEAD"):
+            return _fetch()
+        key = (
+            id(session),
+            ResponseCache.key(method, url, params),
+            repr(sorted((headers or {}).items())),
+            repr(sorted((proxies or {}).items())),
+        )
+        return coalesce.do(key, _fetch)
+
+    return _request_with_retry
+
+
+class RateLimitedAdapter(requests.adapters.HTTPAdapter):
+    """A transport adapter waiting on a rate limiter before sending each request, so every request made through a
+    session is limited, e.g. ``shared_session().mount("https://", RateLimitedAdapter(limiter))``.
+    """
+
+    __attrs__ = requests.adapters.HTTPAdapter.__attrs__ + ["rate_limiter"]
+
+    def __init__(self, rate_limiter: "RateLimiter", **kwargs):
+        """Create an adapter.
+
+        :param rate_limiter: The :class:`~python_core_example.rate_limit.RateLimiter` to wait on.
+        :param kwargs: Additional keyword arguments for ``requests.adapters.HTTPAdapter``.
+        """
+        self.rate_limiter = rate_limiter
+        super().__init__(**kwargs)
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Union[None, float, Tuple[float, float], Tuple[float, None]] = None,
+        verify: Union[bool, str] = True,
+        cert: Union[
+            None, bytes, str, Tuple[Union[bytes, str], Union[bytes, str]]
+        ] = None,
+        proxies: Optional[Mapping[str, str]] = None,
+    ) -> requests.Response:
+        self.rate_limiter.acquire(request.url or "")
+        return super().send(
+            request,
+            stream=stream,
+            timeout=timeout,
+            verify=verify,
+            cert=cert,
+            proxies=proxies,
+        )
+
+
+class RequestResult(NamedTuple):
+    """The outcome of one request made by :func:`request_many`."""
+
+    position: int
+    request: Union[str, Dict[str, Any]]
+    response: Optional[requests.Response]
+    error: Optional[BaseException]
+    duration: float
+
+
+def _pool_size(session: requests.Session) -> int:
+    """Get the number of connections the session keeps per host."""
+    adapter = session.get_adapter("https://")
+    return getattr(adapter, "_pool_maxsize", requests.adapters.DEFAULT_POOLSIZE)
+
+
+@time_api
+def _request_many_fetch(
+    request_fn: Callable[..., requests.Response],
+    session: requests.Session,
+    request: Dict[str, Any],
+) -> requests.Response:
+    return request_fn(session=session, **request)
+
+
+def _request_many_call(
+    request_fn: Callable[..., requests.Response],
+    session: requests.Session,
+    position: int,
+    request: Union[str, Dict[str, Any]],
+) -> RequestResult:
+    start = time.perf_counter()
+    try:
+        response = _request_many_fetch(
+            request_fn,
+            session,
+            {"url": request} if isinstance(request, str) else request,
+        )
+        error = None
+    except Exception as e:
+        response, error = None, e
+    return RequestResult(
+        position, request, response, error, time.perf_counter() - start
+    )
+
+
+def request_many(
+    requests_: Iterable[Union[str, Dict[str, Any]]],
+    request_fn: Optional[Callable[..., requests.Response]] = None,
+    session: Optional[requests.Session] = None,
+    max_workers: Optional[int] = None,
+    max_per_host: Optional[int] = None,
+    ordered: bool = False,
+) -> Iterator[RequestResult]:
+    """Make a batch of requests concurrently on a thread pool, yielding each result once it's available.
+
+    Requests are only handed to the pool once their host is below its concurrency cap, so no worker thread is ever
+    blocked waiting on a busy host while requests for other hosts are queued. Each request is timed with
+    :func:`~python_core_example.common.time_api`, so durations are reported with the other timings.
+
+    :param requests_: The requests, each a URL or a dict of keyword arguments for ``request_fn`` including ``url``.
+        Read lazily, a bounded number ahead of the requests in flight (and, when ``ordered``, of the results waiting
+        for an earlier request to finish).
+    :param request_fn: The function making each request, called with a ``session`` keyword argument, defaulting to
+        :func:`request_with_retry` with its default options.
+    :param session: The session to use, defaulting to :func:`~python_core_example.common.shared_session`.
+    :param max_workers: The number of threads, defaulting to the number of connections the session keeps per host.
+    :param max_per_host: The maximum number of requests in flight to any one host, defaulting to ``max_workers``.
+    :param ordered: Yield results in the order of the requests, rather than as they complete.
+    :returns: An iterator of results. Failed requests are yielded with their error rather than raised, so one failure
+        doesn't abandon the rest of the batch.
+    """
+    if request_fn is None:
+        request_fn = request_with_retry(logger)
+    if session is None:
+        session = shared_session()
+    if max_workers is None:
+        max_workers = _pool_size(session)
+    if max_per_host is None:
+        max_per_host = max_workers
+
+    lookahead = max_workers * REQUEST_MANY_LOOKAHEAD
+    pending: Dict[str, Deque[Tuple[int, Union[str, Dict[str, Any]]]]] = {}
+    pending_count = 0
+    in_flight: Dict[str, int] = collections.defaultdict(int)
+    futures: Dict[concurrent.futures.Future, str] = {}
+    completed: Dict[int, RequestResult] = {}
+    next_position = 0
+    iterator = enumerate(requests_)
+    exhausted = False
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            # Results held back behind a slow request count towards the lookahead, so they can't pile up
+            while not exhausted and pending_count + len(completed) < lookahead:
+                try:
+                    position, request = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                url = request if isinstance(request, str) else request["url"]
+                pending.setdefault(urlsplit(url).netloc, collections.deque()).append(
+                    (position, request)
+                )
+                pending_count += 1
+
+            for host in list(pending):
+                queue = pending[host]
+                while (
+                    queue
+                    and len(futures) < max_workers
+                    and in_flight[host] < max_per_host
+                ):
+                    position, request = queue.popleft()
+                    pending_count -= 1
+                    in_flight[host] += 1
+                    future = pool.submit(
+                        _request_many_call, request_fn, session, position, request
+                    )
+                    futures[future] = host
+                if not queue:
+                    del pending[host]
+
+            if not futures:
+                return
+            done, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
             )
-        if raise_exception_on_faiure_status:
-            raise RuntimeError(
-                f"Invalid response code: {resp.status_code}. Response: {resp.text}"
+            for future in done:
+                host = futures.pop(future)
+                in_flight[host] -= 1
+                if not in_flight[host]:
+                    del in_flight[host]
+                result = future.result()
+                if not ordered:
+                    yield result
+                    continue
+                completed[result.position] = result
+                while next_position in completed:
+                    yield completed.pop(next_position)
+                    next_position += 1
+
+
+def async_session(
+    pool_size: int = ASYNC_POOL_SIZE, **kwargs
+) -> "aiohttp.ClientSession":
+    """Create an ``aiohttp.ClientSession`` with a pooled connector, to share between all requests on an event loop.
+
+    Must be called from a coroutine, and closed when done, e.g. ``async with async_session() as session:``.
+
+    Note: Requires aiohttp to be installed.
+
+    :param pool_size: The number of connections kept open, across all hosts.
+    :param kwargs: Additional keyword arguments for ``aiohttp.ClientSession``.
+    """
+    # Don't require aiohttp in requirements.txt - only needed by async callers
+    import aiohttp
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=pool_size, ttl_dns_cache=300), **kwargs
+    )
+
+
+def async_request_with_retry(
+    logger: logging.Logger,
+    retryable_exceptions: Optional[Tuple[Type[Exception], ...]] = None,
+    retryable_error_messages: Tuple[str, ...] = RETRYABLE_ERROR_MESSAGES,
+    retryable_error_codes: Tuple[int, ...] = RETRYABLE_ERROR_CODES,
+    sleep_time: float = SLEEPTIME,
+    backoff: float = BACKOFF,
+    max_delay: float = 60 * 5,
+    max_tries: int = 5,
+    raise_exception_on_faiure_status: bool = True,
+    budget: Optional[RetryBudget] = retry_budget,
+    breaker: Optional[CircuitBreaker] = None,
+    rate_limiter: Optional["RateLimiter"] = None,
+    max_in_flight: int = ASYNC_MAX_IN_FLIGHT,
+):
+    """An asyncio counterpart of :func:`request_with_retry` for an ``aiohttp.ClientSession``, see :func:`async_session`.
+
+    Responses are classified and retries are scheduled the same way, but backoff sleeps with ``asyncio.sleep`` so
+    waiting requests don't hold a thread, and a semaphore caps the requests in flight (not counting those sleeping
+    between attempts).
+
+    Note: Requires aiohttp to be installed.
+
+    :param retryable_exceptions: The exceptions to retry, defaulting to ``RETRYABLE_EXCEPTIONS`` plus aiohttp's
+        connection, payload and timeout errors.
+    :param breaker: The circuit breaker to check each attempt with, see :func:`request_with_retry`.
+    :param rate_limiter: The rate limiter to wait on before each attempt, without holding an in-flight slot.
+    :param max_in_flight: The maximum number of requests in flight at once on each event loop.
+    :returns: A coroutine function taking the session, url and request options, returning the response with its body
+        already read.
+    """
+    if max_tries < 1:
+        raise ValueError(f"Invalid max_tries: {max_tries}. Must be positive.")
+    # Don't require aiohttp in requirements.txt - only needed by async callers
+    import aiohttp
+
+    if retryable_exceptions is None:
+        retryable_exceptions = RETRYABLE_EXCEPTIONS + (
+            asyncio.TimeoutError,
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+        )
+    # Semaphores can only be used on one event loop
+    semaphores: (
+        "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]"
+    ) = weakref.WeakKeyDictionary()
+
+    @time_api
+    async def _attempt(
+        session: aiohttp.ClientSession,
+        url: str,
+        method: str,
+        headers: Optional[Dict],
+        proxy: Optional[str],
+        params: Optional[Dict],
+    ) -> aiohttp.ClientResponse:
+        with breaker.guard(url) if breaker is not None else nullcontext():
+            if rate_limiter is not None:
+                delay = rate_limiter.reserve(url)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            loop = asyncio.get_running_loop()
+            semaphore = semaphores.get(loop)
+            if semaphore is None:
+                semaphore = semaphores[loop] = asyncio.Semaphore(max_in_flight)
+            async with semaphore:
+                try:
+                    logger.debug("Running request for url (%s).", url)
+                    async with session.request(
+                        method, url, headers=headers, proxy=proxy, params=params
+                    ) as resp:
+                        # Read the body while holding the connection, so it's released back to the pool
+                        await resp.read()
+                except retryable_exceptions as e:
+                    raise RetryableError(
+                        f"Encountered retryable exception in request ({url}): {e}"
+                    )
+            _check_response(
+                url,
+                resp.status,
+                await resp.text(),
+                resp.headers,
+                retryable_error_messages,
+                retryable_error_codes,
+                raise_exception_on_faiure_status,
             )
-        return resp
+            return resp
 
-    return _request_with_retry
+    async def _async_request_with_retry(
+        session: aiohttp.ClientSession,
+        url: str,
+        method: str = "GET",
+        headers: Optional[Dict] = None,
+        proxy: Optional[str] = None,
+        params: Optional[Dict] = None,
+    ) -> aiohttp.ClientResponse:
+        schedule = _Backoff(logger, sleep_time, backoff, max_delay, max_tries, budget)
+        while True:
+            try:
+                return await _attempt(session, url, method, headers, proxy, params)
+            except RetryableError as e:
+                delay = schedule.next_delay(e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    return _async_request_with_retry
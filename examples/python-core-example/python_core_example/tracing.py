@@ -0,0 +1,214 @@
+import asyncio
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stop collecting spans past this point so a long running process can't grow without bound
+TRACE_MAX_SPANS = 1_000_000
+
+
+class Span:
+    """A single timed operation, optionally nested under a parent span."""
+
+    __slots__ = ("name", "span_id", "parent_id", "track", "start", "end")
+
+    def __init__(
+        self,
+        name: str,
+        span_id: int,
+        parent_id: Optional[int],
+        track: Tuple[int, Optional[int]],
+        start: float,
+    ):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.track = track
+        self.start = start
+        self.end: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        """The span duration in seconds, or None if the span hasn't ended."""
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def _current_track() -> Tuple[int, Optional[int]]:
+    """Identify the thread and asyncio task a span runs on, so concurrent spans get separate rows in a viewer."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return threading.get_ident(), None if task is None else id(task)
+
+
+class Tracer:
+    """Collects hierarchical spans and exports them as Chrome trace-event JSON.
+
+    The current span is tracked in a context variable, so spans started in a thread or asyncio task nest under the
+    span that was current when the thread's work or the task was started (for tasks, which copy their context).
+    Tracing is disabled by default, in which case :func:`~python_core_example.common.time_api` skips it entirely.
+    """
+
+    def __init__(self, max_spans: int = TRACE_MAX_SPANS):
+        self.max_spans = max_spans
+        self.enabled = False
+        self.dropped = 0
+        self._spans: List[Span] = []
+        self._ids = itertools.count(1)
+        self._export_paths: List[str] = []
+
+    def enable(self, path: Optional[str] = None) -> None:
+        """Start collecting spans.
+
+        :param path: If provided, export the collected spans to this file when the process exits.
+        """
+        self.enabled = True
+        if path is not None and path not in self._export_paths:
+            self._export_paths.append(path)
+            atexit.register(self.export_chrome_trace, path)
+
+    def disable(self) -> None:
+        """Stop collecting spans, keeping those already collected."""
+        self.enabled = False
+
+    def clear(self) -> None:
+        """Discard all collected spans."""
+        self._spans = []
+        self.dropped = 0
+
+    def spans(self) -> List[Span]:
+        """Get the finished spans, in the order they finished."""
+        return list(self._spans)
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        """Get the span active in the current context, if any."""
+        return _current_span.get()
+
+    def start_span(
+        self, name: str, start: Optional[float] = None, activate: bool = True
+    ) -> Tuple[Span, Optional[contextvars.Token]]:
+        """Start a span as a child of the current span.
+
+        :param name: The span name.
+        :param start: The start time as a ``time.perf_counter()`` value, defaulting to now.
+        :param activate: Make the span current, so spans started before it ends are nested under it.
+        :returns: The span and the token to pass to :meth:`end_span`.
+        """
+        parent = _current_span.get()
+        span = Span(
+            name,
+            next(self._ids),
+            None if parent is None else parent.span_id,
+            _current_track(),
+            time.perf_counter() if start is None else start,
+        )
+        token = _current_span.set(span) if activate else None
+        return span, token
+
+    def end_span(
+        self,
+        span: Span,
+        token: Optional[contextvars.Token] = None,
+        end: Optional[float] = None,
+    ) -> None:
+        """End a span started with :meth:`start_span` and collect it.
+
+        :param span: The span to end.
+        :param token: The token returned by :meth:`start_span`, restoring the previous current span.
+        :param end: The end time as a ``time.perf_counter()`` value, defaulting to now.
+        """
+        span.end = time.perf_counter() if end is None else end
+        if token is not None:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Ended from a different context than it started in, leave that context untouched
+                pass
+        if len(self._spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        # list.append is atomic under the GIL
+        self._spans.append(span)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        """A context manager that traces the enclosed block as a span, if tracing is enabled."""
+        if not self.enabled:
+            yield Span(name, 0, None, _current_track(), time.perf_counter())
+            return
+        span, token = self.start_span(name)
+        try:
+            yield span
+        finally:
+            self.end_span(span, token)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Convert the collected spans to Chrome trace-event format, viewable in Perfetto or ``chrome://tracing``."""
+        pid = os.getpid()
+        tids: Dict[Tuple[int, Optional[int]], int] = {}
+        events: List[Dict[str, Any]] = []
+        for span in self.spans():
+            if span.track not in tids:
+                tids[span.track] = tid = len(tids) + 1
+                thread_ident, task_id = span.track
+                label = f"Thread {thread_ident}"
+                if task_id is not None:
+                    label += f" / Task {task_id:#x}"
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": tid,
+                        "args": {"name": label},
+                    }
+                )
+            events.append(
+                {
+                    "name": span.name,
+                    "ph": "X",
+                    "ts": span.start * 1_000_000,
+                    "dur": (span.duration or 0.0) * 1_000_000,
+                    "pid": pid,
+                    "tid": tids[span.track],
+                    "args": {"span_id": span.span_id, "parent_id": span.parent_id},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path: str) -> str:
+        """Write the collected spans to a Chrome trace-event JSON file.
+
+        :param path: The local file path to write.
+        :returns: The path written.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+        logger.info(
+            "Exported %s spans to %s (%s dropped)",
+            len(self._spans),
+            path,
+            self.dropped,
+        )
+        return path
+
+
+tracer = Tracer()
@@ -11,6 +11,13 @@ from python_core_example.cli import cli
 python_core_example.logging.configure_logging("DEBUG")
 
 
+@pytest.fixture(autouse=True, scope="session")
+def discard_timings_at_exit():
+    # The at-exit timing summary would log to stdout after pytest has closed its capture
+    yield
+    python_core_example.timing_registry.reset()
+
+
 @pytest.fixture
 def patch_manager(mocker, patch_path):
     patch_manager = Mock()
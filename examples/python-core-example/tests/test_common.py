@@ -1,8 +1,21 @@
+import array
+import asyncio
+import subprocess
+import sys
 import time
 
+import numpy
+import pytest
 from python_core_example import common
 
 
+@pytest.fixture(autouse=True)
+def reset_timing_registry():
+    common.timing_registry.reset()
+    yield
+    common.timing_registry.reset()
+
+
 def test_time_api_fast_call_no_log(caplog):
     @common.time_api
     def fast_fn():
@@ -13,6 +26,29 @@ def test_time_api_fast_call_no_log(caplog):
     assert "TIMING" not in caplog.text
 
 
+def test_time_api_records_every_call():
+    @common.time_api
+    def fast_fn():
+        return 1
+
+    for _ in range(10):
+        assert fast_fn() == 1
+
+    summary = common.timing_registry.summary()
+    assert summary[fast_fn.__qualname__]["count"] == 10
+
+
+def test_time_api_records_failed_calls():
+    @common.time_api
+    def failing_fn():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        failing_fn()
+
+    assert common.timing_registry.summary()[failing_fn.__qualname__]["count"] == 1
+
+
 def test_time_api_slow_call_logs(caplog):
     @common.time_api
     def slow_fn():
@@ -23,6 +59,101 @@ def test_time_api_slow_call_logs(caplog):
     assert "TIMING" in caplog.text
 
 
+def test_time_api_cpu_time():
+    @common.time_api(cpu_time=True)
+    def sleeping_fn():
+        time.sleep(0.05)
+
+    sleeping_fn()
+
+    summary = common.timing_registry.summary()
+    assert summary[sleeping_fn.__qualname__]["total"] >= 0.05
+    assert summary[f"{sleeping_fn.__qualname__}[cpu]"]["total"] < 0.05
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cpu_time", [False, True])
+async def test_time_api_coroutine_times_awaited_execution(cpu_time):
+    @common.time_api(cpu_time=cpu_time)
+    async def async_fn():
+        await asyncio.sleep(0.05)
+        return 1
+
+    assert await async_fn() == 1
+
+    summary = common.timing_registry.summary()
+    assert summary[async_fn.__qualname__]["total"] >= 0.05
+    if cpu_time:
+        assert summary[f"{async_fn.__qualname__}[cpu]"]["total"] < 0.05
+
+
+@pytest.mark.asyncio
+async def test_time_api_coroutine_propagates_errors():
+    @common.time_api(cpu_time=True)
+    async def async_fn():
+        await asyncio.sleep(0)
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        await async_fn()
+
+    assert common.timing_registry.summary()[async_fn.__qualname__]["count"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cpu_time", [False, True])
+async def test_time_api_async_generator(cpu_time):
+    @common.time_api(cpu_time=cpu_time)
+    async def async_gen():
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            received = yield i
+            if received is not None:
+                yield received
+
+    assert [i async for i in async_gen()] == [0, 1, 2]
+
+    gen = async_gen()
+    assert await gen.__anext__() == 0
+    assert await gen.asend("sent") == "sent"
+    await gen.aclose()
+
+    summary = common.timing_registry.summary()
+    assert summary[async_gen.__qualname__]["count"] == 2
+    assert summary[async_gen.__qualname__]["max"] >= 0.03
+
+
+def test_timing_registry_flush_logs_and_resets(caplog):
+    registry = common.TimingRegistry(flush_interval=None)
+    registry.record("fn", 0.5)
+    registry.record("fn", 1.5)
+
+    summaries = registry.flush()
+
+    assert summaries["fn"]["count"] == 2
+    assert summaries["fn"]["total"] == 2.0
+    assert "TIMING_SUMMARY" in caplog.text
+    assert registry.summary() == {}
+    assert registry.flush() == {}
+
+
+def test_timing_registry_flushes_at_max_samples():
+    registry = common.TimingRegistry(flush_interval=None, max_samples=3)
+    for _ in range(4):
+        registry.record("fn", 0.001)
+
+    assert registry.summary()["fn"]["count"] == 1
+
+
+def test_timing_registry_flushes_on_interval():
+    registry = common.TimingRegistry(flush_interval=10)
+    registry.record("fn", 0.001, now=registry._last_flush + 1)
+    assert registry.summary()["fn"]["count"] == 1
+
+    registry.record("fn", 0.001, now=registry._last_flush + 10)
+    assert registry.summary() == {}
+
+
 def test_stats_single():
     assert common.stats([1]) == {
         "25th": 1,
@@ -42,6 +173,85 @@ def test_stats_single():
     }
 
 
+def test_stats_percentiles():
+    summary = common.stats(list(range(101)))
+
+    assert summary["25th"] == 25
+    assert summary["75th"] == 75
+    assert summary["99th"] == 99
+    assert summary["median"] == summary["50th"] == summary["mean"] == 50
+    assert summary["count"] == 101
+    assert summary["total"] == 5050
+    assert (summary["min"], summary["max"]) == (0, 100)
+
+
+def test_stats_list_input_unchanged():
+    values = [3.0, 1.0, 2.0]
+    common.stats(values)
+    assert values == [3.0, 1.0, 2.0]
+
+
+@pytest.mark.parametrize(
+    "to_input",
+    [
+        lambda values: array.array("d", values),
+        lambda values: memoryview(array.array("d", values)),
+        lambda values: numpy.array(values),
+    ],
+)
+def test_stats_buffer_inputs(to_input):
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    data = to_input(values)
+
+    assert common.stats(data) == common.stats(values)
+    # Inputs are never partitioned in place
+    assert list(data) == values
+
+
+def test_stats_axis():
+    data = numpy.arange(12.0).reshape(4, 3)
+
+    summary = common.stats(data, axis=0)
+
+    assert summary["count"] == 4
+    for column in range(3):
+        expected = common.stats(data[:, column])
+        for key, value in summary.items():
+            if key != "count":
+                assert value[column] == pytest.approx(expected[key])
+
+
+def test_stats_empty():
+    with pytest.raises(ValueError):
+        common.stats([])
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 100, 999])
+def test_stats_python_matches_numpy(size):
+    values = numpy.random.default_rng(size).lognormal(size=size).tolist()
+
+    summary = common.stats(values)
+
+    expected = common.stats(numpy.array(values))
+    assert summary.keys() == expected.keys()
+    for key, value in summary.items():
+        assert value == pytest.approx(expected[key], rel=1e-12)
+
+
+def test_stats_small_input_skips_numpy():
+    script = "import sys; from python_core_example import stats; stats([1, 2, 3]); assert 'numpy' not in sys.modules"
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+
+def test_stats_without_numpy(mocker):
+    mocker.patch.dict(sys.modules, {"numpy": None})
+    values = list(range(common.STATS_PYTHON_MAX_SIZE * 2))
+
+    assert common.stats(values)["median"] == (len(values) - 1) / 2
+    with pytest.raises(ModuleNotFoundError):
+        common.stats([[1, 2], [3, 4]], axis=0)
+
+
 def test_shared_session_caches_and_sets_keepalive():
     assert common.shared_session() is common.shared_session()
     import socket
@@ -0,0 +1,156 @@
+import email.utils
+import json
+import pickle
+import time
+from unittest.mock import Mock, call
+
+import pytest
+import requests
+from python_core_example.http_cache import ResponseCache, _expires
+
+
+def _response(status_code=200, content=b"body", **headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers = requests.structures.CaseInsensitiveDict(
+        {name.replace("_", "-"): value for name, value in headers.items()}
+    )
+    return response
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(max_entries=2)
+
+
+def _fetch(
+    cache, send, url="https://host/path", params=None, headers=None, session=None
+):
+    return cache.fetch("GET", url, params, headers, send, session)
+
+
+def test_fresh_responses_are_reused(cache):
+    send = Mock(return_value=_response(Cache_Control="max-age=60"))
+    assert _fetch(cache, send).content == b"body"
+    assert _fetch(cache, send).content == b"body"
+    assert len(send.mock_calls) == 1
+    # Params are part of the key, in any order
+    _fetch(cache, send, params={"a": 1, "b": 2})
+    _fetch(cache, send, params={"b": 2, "a": 1})
+    assert len(send.mock_calls) == 2
+    # Requests can insist on revalidating, or bypass the cache
+    _fetch(cache, send, headers={"Cache-Control": "no-store"})
+    assert len(send.mock_calls) == 3
+    # Least recently used entries are evicted
+    _fetch(cache, send, url="https://host/other")
+    _fetch(cache, send, params={"a": 1, "b": 2})
+    _fetch(cache, send)
+    assert len(send.mock_calls) == 5
+
+
+def test_stale_responses_are_revalidated(cache):
+    send = Mock(
+        side_effect=[
+            _response(ETag='"v1"', Cache_Control="no-cache"),
+            _response(304, b"", ETag='"v1"', Cache_Control="max-age=60"),
+            _response(content=b"new"),
+        ]
+    )
+    assert _fetch(cache, send, headers={"Accept": "text/plain"}).content == b"body"
+    revalidated = _fetch(cache, send, headers={"Accept": "text/plain"})
+    assert revalidated.status_code == 200 and revalidated.content == b"body"
+    assert send.mock_calls[1] == call({"Accept": "text/plain", "If-None-Match": '"v1"'})
+    # Fresh after the 304 refreshed its max-age
+    assert _fetch(cache, send).content == b"body"
+    assert _fetch(cache, send, headers={"Cache-Control": "no-cache"}).content == b"new"
+    assert len(send.mock_calls) == 3
+
+
+def test_uncacheable_responses(cache):
+    send = Mock(return_value=_response(Cache_Control="max-age=60, no-store"))
+    _fetch(cache, send)
+    _fetch(cache, send)
+    assert len(send.mock_calls) == 2
+    # No freshness or validators
+    send = Mock(return_value=_response())
+    _fetch(cache, send, url="https://host/plain")
+    _fetch(cache, send, url="https://host/plain")
+    assert len(send.mock_calls) == 2
+    # Only GETs are cached
+    send = Mock(return_value=_response(Cache_Control="max-age=60"))
+    cache.fetch("POST", "https://host/post", None, None, send)
+    cache.fetch("POST", "https://host/post", None, None, send)
+    assert len(send.mock_calls) == 2
+
+
+def test_vary_headers(cache):
+    send = Mock(return_value=_response(Cache_Control="max-age=60", Vary="Accept"))
+    _fetch(cache, send, headers={"accept": "text/plain"})
+    _fetch(cache, send, headers={"Accept": "text/plain"})
+    assert len(send.mock_calls) == 1
+    _fetch(cache, send, headers={"Accept": "application/json"})
+    assert len(send.mock_calls) == 2
+
+
+def test_disk_tier(tmp_path):
+    send = Mock(
+        return_value=_response(Last_Modified="yesterday", Cache_Control="max-age=60")
+    )
+    _fetch(ResponseCache(directory=str(tmp_path)), send)
+    other_process = ResponseCache(directory=str(tmp_path))
+    assert _fetch(other_process, send).content == b"body"
+    assert len(send.mock_calls) == 1
+    entry = other_process.get("GET", "https://host/path")
+    assert entry.validators() == {"If-Modified-Since": "yesterday"}
+    assert entry.headers["last-modified"] == "yesterday"
+
+    # Stored as JSON metadata and the raw body, never unpickled
+    (path,) = tmp_path.iterdir()
+    metadata, body = path.read_bytes().split(b"\n", 1)
+    assert json.loads(metadata)["status_code"] == 200 and body == b"body"
+    path.write_bytes(pickle.dumps(entry))
+    assert (
+        ResponseCache(directory=str(tmp_path)).get("GET", "https://host/path") is None
+    )
+
+
+def test_authorized_requests_bypass_cache(cache):
+    send = Mock(return_value=_response(Cache_Control="max-age=60"))
+    _fetch(cache, send, headers={"Authorization": "Bearer a"})
+    _fetch(cache, send, headers={"authorization": "Bearer b"})
+    assert len(send.mock_calls) == 2
+    assert cache.get("GET", "https://host/path") is None
+
+
+def test_session_credentials_bypass_cache(cache):
+    send = Mock(return_value=_response(Cache_Control="max-age=60"))
+    alice, bob = requests.Session(), requests.Session()
+    alice.auth, bob.auth = ("alice", "a"), ("bob", "b")
+    _fetch(cache, send, session=alice)
+    _fetch(cache, send, session=bob)
+    with_header, with_cookie = requests.Session(), requests.Session()
+    with_header.headers["Authorization"] = "Bearer a"
+    with_cookie.cookies["session"] = "a"
+    _fetch(cache, send, session=with_header)
+    _fetch(cache, send, session=with_cookie)
+    _fetch(cache, send, headers={"Cookie": "session=a"})
+    assert len(send.mock_calls) == 5
+    assert cache.get("GET", "https://host/path") is None
+    # Unless the request removes the session's credentials
+    _fetch(cache, send, headers={"Authorization": None}, session=with_header)
+    _fetch(cache, send, session=requests.Session())
+    assert len(send.mock_calls) == 6
+
+
+def test_expires():
+    now = time.time()
+    assert _expires({"Cache-Control": "max-age=60", "Age": "10"}, now) == now + 50
+    assert _expires({"Cache-Control": "no-cache, max-age=60"}, now) == now
+    date = email.utils.formatdate(now - 100, usegmt=True)
+    expires = email.utils.formatdate(now - 70, usegmt=True)
+    # Expires is relative to the server's Date
+    assert _expires({"Expires": expires, "Date": date}, now) == pytest.approx(
+        now + 30, abs=1
+    )
+    assert _expires({}, now) == now
@@ -0,0 +1,435 @@
+import array
+import concurrent.futures
+import io
+import math
+import mmap
+import multiprocessing
+import pickle
+import time
+
+import numpy
+import pytest
+from python_core_example import math as pce_math
+
+
+@pytest.fixture
+def patch_path():
+    return "python_core_example.math.kernels"
+
+
+@pytest.mark.parametrize(
+    "to_input",
+    [
+        list,
+        iter,
+        lambda values: array.array("d", values),
+        lambda values: memoryview(array.array("d", values)),
+        numpy.array,
+    ],
+)
+def test_dot_product(to_input):
+    assert (
+        pce_math.dot_product(to_input([1.0, 2.0, 3.0]), to_input([4.0, 5.0, 6.0])) == 32
+    )
+
+
+def test_dot_product_stops_at_shorter_vector():
+    assert pce_math.dot_product([1, 2, 3], [4, 5]) == 14
+    assert pce_math.dot_product(numpy.arange(3.0), numpy.arange(2.0)) == 1
+
+
+def test_dot_product_returns_python_scalar():
+    result = pce_math.dot_product(numpy.arange(3), numpy.arange(3))
+    assert type(result) is int
+
+
+def test_dot_product_integer_arrays_dont_overflow():
+    assert (
+        pce_math.dot_product(array.array("b", [100, 100]), array.array("b", [100, 100]))
+        == 20_000
+    )
+    wide = array.array("i", [100_000, 3])
+    assert pce_math.dot_product(wide, wide) == 10_000_000_009
+    assert pce_math.norm(numpy.array([200, 0], dtype=numpy.uint8)) == 200
+    unsigned = numpy.array([3_000_000_000], dtype=numpy.uint32)
+    assert pce_math.dot_product(unsigned, unsigned) == 9_000_000_000_000_000_000
+    with pytest.raises(ValueError):
+        pce_math.dot_product(unsigned.astype(numpy.uint64), unsigned)
+    matrix = numpy.full((2, 2), 60_000, dtype=numpy.int32)
+    assert (
+        pce_math.matrix_vector_product(matrix, matrix[0]).tolist()
+        == [7_200_000_000] * 2
+    )
+
+
+def test_dot_product_without_numpy(patch_manager):
+    patch_manager.patch.object(pce_math.kernels, "optional_numpy", return_value=None)
+    assert (
+        pce_math.dot_product(array.array("d", [1, 2]), array.array("d", [3, 4])) == 11
+    )
+
+
+def test_numpy_only_features_without_numpy(patch_manager):
+    patch_manager.patch.object(pce_math._compat, "optional_numpy", return_value=None)
+    with pytest.raises(ModuleNotFoundError):
+        pce_math.top_k_dot_products([1.0], [[1.0]], k=1)
+
+
+@pytest.mark.parametrize("to_input", [list, numpy.array])
+def test_norm_and_cosine_similarity(to_input):
+    assert pce_math.norm(to_input([3.0, 4.0])) == 5
+    assert pce_math.cosine_similarity(
+        to_input([1.0, 0.0]), to_input([1.0, 1.0])
+    ) == pytest.approx(1 / math.sqrt(2))
+    assert pce_math.cosine_similarity(to_input([0.0, 0.0]), to_input([1.0, 1.0])) == 0
+
+
+def test_cosine_similarity_iterators():
+    assert pce_math.cosine_similarity(iter([2.0, 0.0]), iter([3.0, 0.0])) == 1
+
+
+def test_matrix_vector_product():
+    matrix = [[1.0, 2.0], [3.0, 4.0]]
+    assert pce_math.matrix_vector_product(matrix, [1.0, 1.0]) == [3, 7]
+    assert pce_math.matrix_vector_product(
+        numpy.array(matrix), numpy.ones(2)
+    ).tolist() == [3, 7]
+
+
+def test_sparse_vector_dot_products():
+    sparse = pce_math.SparseVector.from_dict({7: 2.0, 1: 3.0, 4: 0.0}, dimension=10)
+    assert list(sparse.indices) == [1, 7] and sparse.nnz == 2 and len(sparse) == 10
+    dense = [float(i) for i in range(10)]
+    assert pce_math.dot_product(sparse, dense) == 17
+    assert pce_math.dot_product(iter(dense), sparse) == 17
+    assert pce_math.dot_product(sparse, numpy.array(dense)) == 17
+    other = pce_math.SparseVector.from_dense([0, 5, 0, 0, 0, 0, 0, 1])
+    assert pce_math.dot_product(sparse, other) == 17
+    assert other.to_dense() == [0, 5, 0, 0, 0, 0, 0, 1]
+    # Much sparser on one side
+    wide = pce_math.SparseVector(range(0, 1_000, 7), [1.0] * 143)
+    assert pce_math.dot_product(sparse, wide) == 2
+    assert pce_math.dot_product(pce_math.SparseVector([], []), wide) == 0
+    # Stops at the end of a shorter dense vector
+    assert pce_math.dot_product(sparse, dense[:5]) == 3
+    assert pce_math.dot_product(sparse, numpy.array(dense[:5])) == 3
+    assert pce_math.dot_product(iter(dense[:1]), sparse) == 0
+
+
+def test_sparse_vector_norm_and_cosine_similarity():
+    sparse = pce_math.SparseVector.from_dict({1: 3.0, 7: 4.0}, dimension=10)
+    assert pce_math.norm(sparse) == 5
+    assert pce_math.norm(pce_math.SparseVector([], [])) == 0
+    dense = [0.0, 3.0, 0.0, 0.0, 0.0, 0.0, 0.0, 4.0]
+    for to_input in (list, iter, numpy.array):
+        assert pce_math.cosine_similarity(sparse, to_input(dense)) == pytest.approx(1)
+        assert pce_math.cosine_similarity(to_input(dense), sparse) == pytest.approx(1)
+    assert pce_math.cosine_similarity(sparse, sparse) == pytest.approx(1)
+    orthogonal = pce_math.SparseVector.from_dict({2: 1.0})
+    assert pce_math.cosine_similarity(sparse, orthogonal) == 0
+
+
+def test_sparse_vector_invalid():
+    with pytest.raises(ValueError):
+        pce_math.SparseVector([2, 1], [1.0, 1.0])
+    with pytest.raises(ValueError):
+        pce_math.SparseVector([1], [1.0, 2.0])
+
+
+def test_sparse_matrix():
+    rows = [{3: 1.0, 0: 2.0}, {}, {5: 4.0}]
+    matrix = pce_math.SparseMatrix.from_dicts(rows)
+    assert matrix.shape == (3, 6)
+    assert matrix.row(0).to_dict() == {0: 2.0, 3: 1.0}
+    dense = numpy.arange(6, dtype=float)
+    assert matrix.dot(dense).tolist() == [3.0, 0.0, 20.0]
+    assert matrix.dot(dense[:4]).tolist() == [3.0, 0.0, 0.0]
+    query = pce_math.SparseVector.from_dict({3: 2.0, 5: 1.0, 9: 1.0})
+    assert matrix.dot(query).tolist() == [2.0, 0.0, 4.0]
+    stacked = pce_math.SparseMatrix.from_vectors([matrix.row(i) for i in range(3)])
+    assert stacked.dot(dense).tolist() == [3.0, 0.0, 20.0]
+
+
+def test_shared_vector_pickles_by_name():
+    with pce_math.SharedVector.create([1.0, 2.0, 3.0]) as shared:
+        attached = pickle.loads(pickle.dumps(shared))
+        attached.array[0] = 5.0
+        assert shared.array.tolist() == [5.0, 2.0, 3.0]
+        attached.close()
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_parallel_dot_product_deterministic(max_workers):
+    generator = numpy.random.default_rng(0)
+    vector1, vector2 = generator.normal(size=(2, 10_001))
+    expected = math.fsum(
+        vector1[start : start + 1_000].dot(vector2[start : start + 1_000])
+        for start in range(0, 10_001, 1_000)
+    )
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        result = pce_math.parallel_dot_product(
+            vector1, vector2.tolist() + [2.0], chunk_size=1_000, executor=pool
+        )
+    assert result == expected
+    assert result == pytest.approx(vector1.dot(vector2))
+
+
+def test_parallel_dot_product_short_vectors():
+    assert pce_math.parallel_dot_product([1.0, 2.0, 3.0], [4.0, 5.0]) == 14
+    with pce_math.SharedVector.create([1.0, 2.0]) as shared:
+        assert pce_math.parallel_dot_product(shared, shared) == 5
+    assert len(shared) == 2
+    with pytest.raises(ValueError):
+        pce_math.parallel_dot_product(shared, shared)
+
+
+def test_parallel_dot_product_integer_arrays():
+    values = numpy.full(10, 100, dtype=numpy.int8)
+    assert pce_math.parallel_dot_product(values, values) == 100_000
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        assert (
+            pce_math.parallel_dot_product(values, values, chunk_size=3, executor=pool)
+            == 100_000
+        )
+
+
+@pytest.fixture
+def stream_values():
+    return numpy.random.default_rng(0).normal(size=1_003)
+
+
+def test_iter_blocks_sources(stream_values, tmp_path):
+    path = tmp_path / "values.bin"
+    stream_values.tofile(path)
+    pieces = (stream_values[start : start + 7] for start in range(0, 1_003, 7))
+    sources = [
+        stream_values,
+        path,
+        str(path),
+        io.BytesIO(stream_values.tobytes()),
+        stream_values.tobytes(),
+        iter(stream_values.tolist()),
+        pieces,
+    ]
+    for source in sources:
+        blocks = [
+            block.copy() for block in pce_math.iter_blocks(source, block_size=100)
+        ]
+        assert [len(block) for block in blocks] == [100] * 10 + [3]
+        assert numpy.concatenate(blocks).tolist() == stream_values.tolist()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        assert pce_math.streaming_dot_product(m, stream_values) == pytest.approx(
+            stream_values.dot(stream_values)
+        )
+
+
+def test_iter_blocks_partial_value():
+    with pytest.raises(ValueError):
+        list(pce_math.iter_blocks(io.BytesIO(b"\x00" * 12)))
+
+
+def test_streaming_dot_product(stream_values, tmp_path):
+    path = tmp_path / "values.bin"
+    stream_values.astype("<f4").tofile(path)
+    expected = stream_values.astype("<f4").astype(float).dot(stream_values)
+    assert pce_math.streaming_dot_product(
+        path, (value for value in stream_values), block_size=64, dtype="<f4"
+    ) == pytest.approx(expected)
+    # Stops at the end of the shorter vector
+    assert pce_math.streaming_dot_product(iter([1.0, 2.0, 3.0]), [4.0, 5.0]) == 14
+    assert pce_math.streaming_dot_product(iter([]), stream_values) == 0
+    values = numpy.full(10, 100, dtype=numpy.int8)
+    assert pce_math.streaming_dot_product(values, values, block_size=4) == 100_000
+
+
+@pytest.fixture
+def corpus():
+    return numpy.random.default_rng(0).standard_normal((1_000, 16))
+
+
+@pytest.mark.parametrize("block_bytes", [pce_math.search.TOP_K_BLOCK_BYTES, 1_000])
+def test_top_k_dot_products(corpus, block_bytes):
+    query = corpus[3] + 0.01
+
+    indexes, scores = pce_math.top_k_dot_products(
+        query, corpus, k=5, block_bytes=block_bytes
+    )
+
+    expected = numpy.argsort(-(corpus @ query))[:5]
+    assert indexes.tolist() == expected.tolist()
+    assert scores.tolist() == (corpus @ query)[expected].tolist()
+
+
+def test_top_k_dot_products_query_matrix(corpus):
+    queries = corpus[:3]
+
+    indexes, scores = pce_math.top_k_dot_products(
+        queries, corpus, k=4, block_bytes=1_000
+    )
+
+    assert indexes.shape == scores.shape == (3, 4)
+    assert (
+        indexes.tolist() == numpy.argsort(-(queries @ corpus.T), axis=1)[:, :4].tolist()
+    )
+
+
+def test_top_k_dot_products_small_corpus(corpus):
+    indexes, scores = pce_math.top_k_dot_products(corpus[0], corpus[:3], k=10)
+
+    assert sorted(indexes.tolist()) == [0, 1, 2]
+    assert scores.tolist() == sorted(scores.tolist(), reverse=True)
+
+
+@pytest.mark.parametrize("k, dimension", [(0, 16), (1, 8)])
+def test_top_k_dot_products_invalid(corpus, k, dimension):
+    with pytest.raises(ValueError):
+        pce_math.top_k_dot_products(numpy.ones(dimension), corpus, k=k)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "vectors.bin")
+
+
+def test_vector_store_round_trip(corpus, store_path):
+    store = pce_math.VectorStore.create(store_path, corpus)
+
+    assert len(store) == len(corpus)
+    assert store.dimension == corpus.shape[1]
+    assert isinstance(store.vectors, numpy.memmap)
+    numpy.testing.assert_array_equal(store[:], corpus.astype(numpy.float32))
+
+    reopened = pickle.loads(pickle.dumps(store))
+    assert reopened.path == store_path
+    numpy.testing.assert_array_equal(reopened.vectors, store.vectors)
+
+
+def test_vector_store_batches_and_search(corpus, store_path):
+    store = pce_math.VectorStore.create(store_path, numpy.array_split(corpus, 7))
+
+    indexes, _ = store.top_k(corpus[10], k=3)
+
+    expected, _ = pce_math.top_k_dot_products(
+        corpus[10].astype(numpy.float32), corpus.astype(numpy.float32), k=3
+    )
+    assert indexes.tolist() == expected.tolist()
+    assert store.dot_products(corpus[10]).shape == (len(corpus),)
+
+
+def test_vector_store_invalid(store_path):
+    with pytest.raises(ValueError):
+        pce_math.VectorStore.create(store_path, [])
+    with pytest.raises(ValueError):
+        pce_math.VectorStore.create(
+            store_path, [numpy.ones((2, 3)), numpy.ones((2, 4))]
+        )
+    with open(store_path, "wb") as f:
+        f.write(b"not a vector store file at all, really")
+    with pytest.raises(ValueError):
+        pce_math.VectorStore(store_path)
+
+
+@pytest.fixture
+def clustered_corpus():
+    rng = numpy.random.default_rng(0)
+    centers = rng.standard_normal((20, 16))
+    vectors = centers[rng.integers(0, 20, 2_000)] + 0.3 * rng.standard_normal(
+        (2_000, 16)
+    )
+    return (vectors / numpy.linalg.norm(vectors, axis=1, keepdims=True)).astype(
+        numpy.float32
+    )
+
+
+def _recall(found, expected):
+    return numpy.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
+
+
+def test_ivf_index_matches_exact_search_when_probing_all_lists(clustered_corpus):
+    index = pce_math.IVFIndex.build(clustered_corpus)
+    queries = clustered_corpus[:10]
+
+    ids, scores = index.query(queries, k=5, n_probe=len(index.centroids))
+
+    expected_ids, expected_scores = pce_math.top_k_dot_products(
+        queries, clustered_corpus, k=5
+    )
+    assert ids.tolist() == expected_ids.tolist()
+    numpy.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+    assert _recall(index.query(queries, k=5)[0], expected_ids) > 0.9
+
+
+def test_ivf_index_add_ids_and_missing_results(clustered_corpus):
+    index = pce_math.IVFIndex(clustered_corpus[:4], n_probe=1)
+    index.add(clustered_corpus[:4], ids=[10, 11, 12, 13])
+    index.add(clustered_corpus[4:6])
+
+    assert len(index) == 6
+    ids, scores = index.query(clustered_corpus[0], k=3)
+    assert ids[0] == 10
+    assert ids[-1] == -1 and scores[-1] == -numpy.inf
+    assert sorted(index.ids.tolist()) == [10, 11, 12, 13, 14, 15]
+    with pytest.raises(ValueError):
+        index.add(clustered_corpus[:2], ids=[1])
+    with pytest.raises(ValueError):
+        index.query(clustered_corpus[0], k=0)
+
+
+def test_ivf_index_add_batches_matches_single_add(clustered_corpus):
+    centroids = clustered_corpus[::100]
+    whole = pce_math.IVFIndex(centroids)
+    whole.add(clustered_corpus)
+    batched = pce_math.IVFIndex(centroids)
+    for start in range(0, len(clustered_corpus), 37):
+        batched.add(clustered_corpus[start : start + 37])
+        if start == 370:
+            # Merge part way through, so later batches are inserted into existing lists
+            batched.query(clustered_corpus[0], k=1)
+
+    assert len(batched) == len(clustered_corpus)
+    numpy.testing.assert_array_equal(batched.offsets, whole.offsets)
+    numpy.testing.assert_array_equal(batched.ids, whole.ids)
+    numpy.testing.assert_array_equal(batched.vectors, whole.vectors)
+
+
+@pytest.mark.parametrize("name", ["index.npz", "index"])
+def test_ivf_index_save_load(clustered_corpus, tmp_path, name):
+    index = pce_math.IVFIndex.build(clustered_corpus, n_lists=10, n_probe=3)
+    path = str(tmp_path / name)
+
+    index.save(path)
+    loaded = pce_math.IVFIndex.load(path)
+
+    # Saved to exactly the given path, with or without the .npz suffix
+    assert [child.name for child in tmp_path.iterdir()] == [name]
+    assert loaded.n_probe == 3
+    for found, expected in zip(
+        loaded.query(clustered_corpus[:5], k=5), index.query(clustered_corpus[:5], k=5)
+    ):
+        numpy.testing.assert_array_equal(found, expected)
+
+
+@pytest.mark.performance
+def test_ivf_index_recall_and_latency_vs_exact():
+    rng = numpy.random.default_rng(0)
+    centers = rng.standard_normal((200, 64))
+    corpus = centers[rng.integers(0, 200, 200_000)] + 0.5 * rng.standard_normal(
+        (200_000, 64)
+    )
+    corpus = (corpus / numpy.linalg.norm(corpus, axis=1, keepdims=True)).astype(
+        numpy.float32
+    )
+    queries = corpus[rng.integers(0, len(corpus), 100)]
+    index = pce_math.IVFIndex.build(corpus)
+
+    start = time.perf_counter()
+    expected, _ = pce_math.top_k_dot_products(queries, corpus, k=10)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found, _ = index.query(queries, k=10)
+    approximate_seconds = time.perf_counter() - start
+
+    assert _recall(found, expected) > 0.95
+    assert approximate_seconds < exact_seconds
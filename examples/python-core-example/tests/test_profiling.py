@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import threading
+import time
+import tracemalloc
+
+import pytest
+from python_core_example import common, profiling
+
+
+@pytest.fixture
+def profiler(mocker, tmp_path):
+    profiler = profiling.SlowCallProfiler(directory=str(tmp_path))
+    mocker.patch("python_core_example.common.slow_call_profiler", profiler)
+    return profiler
+
+
+@pytest.mark.parametrize(
+    "threshold, expected",
+    [(1, 1.0), (0.5, 0.5), ("p99", "p99"), (" P99.9 ", "p99.9")],
+)
+def test_parse_profile_threshold(threshold, expected):
+    assert profiling.parse_profile_threshold(threshold) == expected
+
+
+@pytest.mark.parametrize("threshold", [-1, "99", "p100", "p0", "slow"])
+def test_parse_profile_threshold_invalid(threshold):
+    with pytest.raises(ValueError):
+        profiling.parse_profile_threshold(threshold)
+
+
+def test_time_api_profiles_slow_call(profiler, tmp_path, caplog):
+    @common.time_api(profile_threshold=0.01)
+    def slow_fn():
+        time.sleep(0.2)
+
+    slow_fn()
+
+    (profile,) = tmp_path.iterdir()
+    assert profile.name.startswith("test_time_api_profiles_slow_call._locals_.slow_fn-")
+    assert profile.suffix == ".folded"
+    assert "slow_fn (test_profiling.py" in profile.read_text()
+    assert "SLOW_CALL_PROFILE" in caplog.text
+    assert profiler._in_flight == {}
+
+
+def test_time_api_fast_call_not_profiled(profiler, tmp_path):
+    @common.time_api(profile_threshold=1)
+    def fast_fn():
+        return 1
+
+    assert fast_fn() == 1
+    assert list(tmp_path.iterdir()) == []
+    assert profiler._in_flight == {}
+
+
+def test_running_percentile_threshold(profiler):
+    assert profiler.start("fn", "p99") is None
+
+    for i in range(profiling.PROFILE_MIN_CALLS):
+        profiler.observe("fn", i / 1_000, "p99")
+
+    assert profiler.threshold("fn", "p99") == 0.099
+    call = profiler.start("fn", "p99")
+    assert call.deadline > time.perf_counter()
+    assert profiler.finish(call, 0.001) is None
+
+
+def test_sample_only_past_deadline(profiler):
+    pending = profiler.start("pending", 60)
+    due = profiler.start("due", 0)
+
+    profiler.sample()
+
+    assert not pending.stacks
+    assert sum(due.stacks.values()) == 1
+    assert "test_sample_only_past_deadline" in next(iter(due.stacks))
+
+
+def test_finish_while_sampling(profiler, tmp_path, mocker):
+    # Every sample adds a new stack, so the counter grows while finished calls are written
+    counter = itertools.count()
+    mocker.patch.object(
+        profiling, "_fold", side_effect=lambda frame: str(next(counter))
+    )
+    call = profiler.start("fn", 0)
+    stop = threading.Event()
+
+    def _sample():
+        while not stop.is_set():
+            profiler._in_flight[id(call)] = call
+            profiler.sample()
+
+    sampler = threading.Thread(target=_sample)
+    sampler.start()
+    try:
+        for _ in range(50):
+            profiler.finish(call, 1)
+    finally:
+        stop.set()
+        sampler.join()
+    assert len(list(tmp_path.iterdir())) > 0
+
+
+@pytest.mark.asyncio
+async def test_time_api_coroutine_not_profiled(profiler, tmp_path):
+    @common.time_api(profile_threshold=0)
+    async def slow_coroutine():
+        await asyncio.sleep(0.05)
+
+    @common.time_api(profile_threshold=0)
+    async def slow_generator():
+        await asyncio.sleep(0.05)
+        yield 1
+
+    profiler.sample_interval = 0.001
+    await slow_coroutine()
+    assert [item async for item in slow_generator()] == [1]
+
+    assert list(tmp_path.iterdir()) == []
+    assert profiler._sampler is None
+
+
+@pytest.fixture
+def tracker(mocker):
+    tracker = profiling.AllocationTracker()
+    mocker.patch("python_core_example.common.allocation_tracker", tracker)
+    return tracker
+
+
+def test_time_api_tracks_allocations(tracker):
+    common.timing_registry.reset()
+
+    @common.time_api(track_allocations=True)
+    def allocating_fn():
+        transient = bytearray(1_000_000)
+        del transient
+        return bytearray(100_000)
+
+    kept = allocating_fn()
+
+    summary = common.timing_registry.summary()
+    common.timing_registry.reset()
+    name = allocating_fn.__qualname__
+    assert summary[f"{name}[alloc_peak]"]["max"] >= 1_000_000
+    assert 100_000 <= summary[f"{name}[alloc_net]"]["max"] < 1_000_000
+    assert len(kept) == 100_000
+    assert not tracemalloc.is_tracing()
+
+
+def test_time_api_samples_allocations(tracker, mocker):
+    mocker.patch("python_core_example.common.random.random", side_effect=[0.5, 0.001])
+    start = mocker.spy(tracker, "start")
+
+    @common.time_api(track_allocations=0.01)
+    def fn():
+        return 1
+
+    fn()
+    fn()
+
+    assert start.call_count == 1
+
+
+@pytest.mark.parametrize("track_allocations", [-0.1, 2])
+def test_time_api_invalid_track_allocations(track_allocations):
+    with pytest.raises(ValueError):
+        common.time_api(track_allocations=track_allocations)
+
+
+def test_nested_allocation_peaks(tracker):
+    outer = tracker.start()
+    transient = bytearray(1_000_000)
+    del transient
+    inner = tracker.start()
+    inner_net, inner_peak = tracker.finish(inner)
+    outer_net, outer_peak = tracker.finish(outer)
+
+    assert inner_peak < 1_000_000
+    assert outer_peak >= 1_000_000
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_elsewhere_is_left_running(tracker):
+    tracemalloc.start()
+    try:
+        tracker.finish(tracker.start())
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
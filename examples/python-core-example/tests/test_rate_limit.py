@@ -0,0 +1,55 @@
+import concurrent.futures
+import multiprocessing
+import pickle
+import time
+
+import pytest
+from python_core_example.rate_limit import RateLimiter
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    limiter = RateLimiter(20, burst=3, host_rates={"slow": 5}, directory=str(tmp_path))
+    yield limiter
+    limiter.close()
+
+
+def test_rate_limiter_burst_then_spaced(limiter):
+    delays = [limiter.reserve("https://fast/path") for _ in range(5)]
+    assert delays[:3] == [0, 0, 0]
+    assert delays[3] == pytest.approx(0.05, abs=0.01)
+    assert delays[4] == pytest.approx(0.1, abs=0.01)
+    # Hosts are limited separately, at their own rate
+    assert [limiter.reserve("slow") for _ in range(4)][-1] == pytest.approx(
+        0.2, abs=0.01
+    )
+    assert limiter.reserve("https://other/") == 0
+
+
+def test_rate_limiter_acquire_waits(limiter):
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire("fast")
+    assert time.perf_counter() - start >= 0.09
+
+
+def test_rate_limiter_shared_by_limiters_and_processes(limiter, tmp_path):
+    # Limiters on the same directory share limits, even when created separately
+    other = RateLimiter(20, burst=3, directory=str(tmp_path))
+    assert [other.reserve("fast") for _ in range(3)] == [0, 0, 0]
+    assert limiter.reserve("fast") == pytest.approx(0.05, abs=0.01)
+    other.close()
+
+    shared = pickle.loads(pickle.dumps(limiter))
+    assert shared.directory == limiter.directory and shared.rate == 20
+    spawn = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=3, mp_context=spawn
+    ) as pool:
+        # Start the workers before timing
+        list(pool.map(time.sleep, [0.1] * 3))
+        start = time.perf_counter()
+        list(pool.map(shared.acquire, ["https://spawned/"] * 12))
+        elapsed = time.perf_counter() - start
+    # 3 requests in a burst, then 9 more spaced at 20 per second
+    assert elapsed >= 0.4
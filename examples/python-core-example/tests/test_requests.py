@@ -1,8 +1,35 @@
+import asyncio
+import concurrent.futures
+import email.utils
+import random
+import threading
+import time
+import traceback
 from contextlib import ExitStack as DoesNotRaise
 from unittest.mock import Mock, call, sentinel
 
 import pytest
-from python_core_example import request_with_retry
+import pytest_asyncio
+import requests
+from python_core_example import (
+    async_request_with_retry,
+    async_session,
+    request_many,
+    request_with_retry,
+    timing_registry,
+)
+from python_core_example.http_cache import ResponseCache
+from python_core_example.requests import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimitedAdapter,
+    RetryableError,
+    RetryBudget,
+    SingleFlight,
+    _Backoff,
+    _parse_retry_after,
+    _pool_size,
+)
 
 
 @pytest.fixture
@@ -42,3 +69,505 @@ def test_request_with_retry(
             stream=sentinel.stream,
         ),
     ]
+
+
+def _response(status_code, headers=None):
+    return Mock(status_code=status_code, text="Error", headers=headers or {})
+
+
+@pytest.mark.parametrize(
+    "responses, max_delay, expectation, min_delay",
+    [
+        # Honors Retry-After on 429 and 503
+        (
+            [_response(503, {"Retry-After": "0.05"}), _response(200)],
+            1,
+            DoesNotRaise(),
+            0.05,
+        ),
+        # But not on other retryable statuses
+        (
+            [_response(500, {"Retry-After": "0.05"}), _response(200)],
+            1,
+            DoesNotRaise(),
+            0,
+        ),
+        # And gives up if the server asks for more than the maximum delay
+        (
+            [_response(429, {"Retry-After": "10"})],
+            1,
+            pytest.raises(RetryableError),
+            None,
+        ),
+    ],
+)
+def test_request_with_retry_retry_after(responses, max_delay, expectation, min_delay):
+    session = Mock()
+    session.request.side_effect = responses
+    logger = Mock()
+    _request_with_retry = request_with_retry(
+        logger=logger, sleep_time=0.001, max_delay=max_delay, budget=None
+    )
+    with expectation:
+        assert _request_with_retry(session, sentinel.url) == responses[-1]
+    assert len(session.request.mock_calls) == len(responses)
+    if min_delay is not None:
+        [warning] = logger.warning.mock_calls
+        delay = warning.args[2]
+        assert min_delay <= delay <= 0.003 + min_delay
+
+
+@pytest.mark.parametrize("factory", [request_with_retry, async_request_with_retry])
+@pytest.mark.parametrize("max_tries", [0, -1])
+def test_request_with_retry_invalid_max_tries(factory, max_tries):
+    with pytest.raises(ValueError, match="max_tries"):
+        factory(Mock(), max_tries=max_tries)
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after("5") == 5
+    assert _parse_retry_after(None) is None
+    assert _parse_retry_after("soon") is None
+    in_a_minute = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 < _parse_retry_after(in_a_minute) <= 60
+    assert _parse_retry_after(email.utils.formatdate(0, usegmt=True)) == 0
+
+
+def test_backoff_decorrelated_jitter():
+    random.seed(0)
+    schedule = _Backoff(Mock(), 1, 3, 20, -1, None)
+    previous = 1
+    delays = []
+    for _ in range(50):
+        delay = schedule.next_delay(RetryableError())
+        assert 1 <= delay <= min(20, previous * 3)
+        delays.append(delay)
+        previous = delay
+    assert len(set(delays)) > 10 and max(delays) == 20
+    # Stops after max_tries attempts
+    schedule = _Backoff(Mock(), 1, 3, 20, 2, None)
+    assert schedule.next_delay(RetryableError()) is not None
+    assert schedule.next_delay(RetryableError()) is None
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    assert budget.try_retry()
+    assert not budget.try_retry()
+    budget.record_request()
+    assert not budget.try_retry()
+    budget.record_request()
+    assert budget.try_retry()
+    # Each request made by request_with_retry deposits, each retry withdraws
+    session = Mock()
+    session.request.return_value = _response(500)
+    logger = Mock()
+    _request_with_retry = request_with_retry(
+        logger=logger, sleep_time=0, max_tries=10, budget=budget
+    )
+    with pytest.raises(RetryableError):
+        _request_with_retry(session, sentinel.url)
+    assert len(session.request.mock_calls) == 1
+    assert "retry budget exhausted" in logger.warning.mock_calls[0].args[0]
+    budget.record_request()
+    with pytest.raises(RetryableError):
+        _request_with_retry(session, sentinel.url)
+    assert len(session.request.mock_calls) == 3
+
+
+def _fail(breaker, url, error=RetryableError):
+    with pytest.raises(error):
+        with breaker.guard(url):
+            raise error()
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(min_requests=4, failure_rate=0.5, open_time=0.05)
+    with breaker.guard("http://a/"):
+        pass
+    _fail(breaker, "http://a/")
+    # Other errors mean the host is responding
+    _fail(breaker, "http://a/x", RuntimeError)
+    assert breaker.state("a") == "closed"
+    _fail(breaker, "http://a/")
+    assert breaker.state("a") == "open"
+    with pytest.raises(CircuitOpenError) as error:
+        with breaker.guard("http://a/"):
+            pytest.fail("Request shouldn't be sent")
+    assert 0 < error.value.retry_after <= 0.05
+    # Other hosts are unaffected
+    with breaker.guard("http://b/"):
+        pass
+
+    time.sleep(0.05)
+    assert breaker.state("a") == "half-open"
+    # A failed probe reopens the circuit
+    _fail(breaker, "http://a/")
+    assert breaker.state("a") == "open"
+    time.sleep(0.05)
+    with breaker.guard("http://a/"):
+        # Only one probe at a time
+        _fail(breaker, "http://a/", CircuitOpenError)
+    assert breaker.state("a") == "closed"
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_cancelled_probe():
+    breaker = CircuitBreaker(min_requests=1, open_time=0, probes=1)
+    _fail(breaker, "http://a/")
+    assert breaker.state("a") == "half-open"
+
+    async def _probe():
+        with breaker.guard("http://a/"):
+            await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(_probe(), 0.01)
+    # A cancelled probe doesn't close the circuit, but frees its slot for the next probe
+    assert breaker.state("a") == "half-open"
+    with breaker.guard("http://a/"):
+        pass
+    assert breaker.state("a") == "closed"
+
+
+def test_request_with_retry_circuit_breaker():
+    session = Mock()
+    session.request.return_value = _response(503)
+    breaker = CircuitBreaker(min_requests=3)
+    _request_with_retry = request_with_retry(
+        logger=Mock(), sleep_time=0, max_tries=10, budget=None, breaker=breaker
+    )
+    with pytest.raises(CircuitOpenError):
+        _request_with_retry(session, "http://a/")
+    assert len(session.request.mock_calls) == 3
+    with pytest.raises(CircuitOpenError):
+        _request_with_retry(session, "http://a/")
+    assert len(session.request.mock_calls) == 3
+
+
+def test_request_with_retry_rate_limiter():
+    session = Mock()
+    session.request.side_effect = [_response(500), _response(200)]
+    rate_limiter = Mock()
+    _request_with_retry = request_with_retry(
+        logger=Mock(), sleep_time=0, budget=None, rate_limiter=rate_limiter
+    )
+    _request_with_retry(session, sentinel.url)
+    assert rate_limiter.acquire.mock_calls == [call(sentinel.url)] * 2
+
+
+def test_rate_limited_adapter(mocker):
+    send = mocker.patch.object(
+        requests.adapters.HTTPAdapter, "send", return_value=sentinel.response
+    )
+    rate_limiter = Mock()
+    session = requests.Session()
+    session.mount("https://", RateLimitedAdapter(rate_limiter, pool_maxsize=3))
+    request = requests.Request("GET", "https://host/path").prepare()
+    assert session.get_adapter(request.url).send(request) == sentinel.response
+    rate_limiter.acquire.assert_called_once_with("https://host/path")
+    assert len(send.mock_calls) == 1
+    assert _pool_size(session) == 3
+
+
+def test_request_with_retry_cache():
+    response = _response(200, {"ETag": '"v1"', "Cache-Control": "no-cache"})
+    response.content = b"body"
+    session = requests.Session()
+    session.request = Mock(side_effect=[response, _response(304, {"ETag": '"v1"'})])
+    _request_with_retry = request_with_retry(
+        logger=Mock(), budget=None, cache=ResponseCache()
+    )
+    assert _request_with_retry(session, "https://host/").content == b"body"
+    revalidated = _request_with_retry(session, "https://host/", headers={"A": "b"})
+    assert revalidated.status_code == 200 and revalidated.content == b"body"
+    assert session.request.mock_calls[1] == call(
+        "GET",
+        "https://host/",
+        headers={"A": "b", "If-None-Match": '"v1"'},
+        proxies=None,
+        stream=False,
+        params=None,
+    )
+
+
+def _concurrently(fn, threads=10):
+    """Call fn from several threads started together, returning their results or exceptions."""
+    barrier = threading.Barrier(threads)
+
+    def _call():
+        barrier.wait()
+        try:
+            return fn()
+        except Exception as e:
+            return e
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(lambda _: _call(), range(threads)))
+
+
+def test_single_flight():
+    single_flight = SingleFlight()
+    fn = Mock(side_effect=lambda: time.sleep(0.1) or object())
+    results = _concurrently(lambda: single_flight.do("key", fn))
+    assert len(fn.mock_calls) == 1
+    assert all(result is results[0] for result in results)
+    # Later calls start a new flight
+    assert single_flight.do("key", fn) is not results[0]
+    assert single_flight.do("other", lambda: sentinel.other) == sentinel.other
+
+
+def test_single_flight_errors_have_separate_tracebacks():
+    def fn():
+        time.sleep(0.1)
+        raise RetryableError("boom", retry_after=3)
+
+    (alone,) = _concurrently(lambda: SingleFlight().do("key", fn), threads=1)
+    single_flight = SingleFlight()
+    errors = _concurrently(lambda: single_flight.do("key", fn), threads=20)
+
+    (original,) = [error for error in errors if error.__cause__ is None]
+    assert len({id(error) for error in errors}) == 20
+    assert all(
+        type(error) is RetryableError
+        and error.args == ("boom",)
+        and error.retry_after == 3
+        and error.__cause__ in (None, original)
+        for error in errors
+    )
+    frames = traceback.extract_tb(original.__traceback__)
+    assert len(frames) == len(traceback.extract_tb(alone.__traceback__))
+    for error in errors:
+        if error is not original:
+            assert "fn" not in [
+                frame.name for frame in traceback.extract_tb(error.__traceback__)
+            ]
+
+
+class _StatusError(Exception):
+    def __init__(self, status, *, url):
+        super().__init__(f"{url} returned {status}")
+        self.status = status
+        self.url = url
+
+
+class _UncopyableError(Exception):
+    def __new__(cls, status):
+        return super().__new__(cls, status)
+
+    def __init__(self, status):
+        super().__init__(status, "extra")
+
+
+@pytest.mark.parametrize(
+    "error, attributes",
+    [
+        (_StatusError(503, url="http://a/"), {"status": 503, "url": "http://a/"}),
+        (_UncopyableError(503), {"args": (503, "extra")}),
+    ],
+)
+def test_single_flight_errors_keep_their_type(error, attributes):
+    def fn():
+        time.sleep(0.1)
+        raise error
+
+    single_flight = SingleFlight()
+    errors = _concurrently(lambda: single_flight.do("key", fn), threads=5)
+    assert all(type(e) is type(error) for e in errors)
+    assert all(getattr(e, k) == v for e in errors for k, v in attributes.items())
+
+
+@pytest.mark.parametrize(
+    "responses, method, requests_made, expected_type",
+    [
+        ([_response(200)], "GET", 1, Mock),
+        ([_response(404)], "GET", 1, RuntimeError),
+        ([_response(503), _response(200)], "GET", 2, Mock),
+        # Only GET and HEAD requests are coalesced
+        ([_response(200)] * 10, "POST", 10, Mock),
+    ],
+)
+def test_request_with_retry_single_flight(
+    responses, method, requests_made, expected_type
+):
+    session = Mock()
+    remaining = iter(responses)
+    session.request.side_effect = lambda *args, **kwargs: time.sleep(0.1) or next(
+        remaining
+    )
+    _request_with_retry = request_with_retry(
+        logger=Mock(), sleep_time=0, budget=None, coalesce=SingleFlight()
+    )
+    results = _concurrently(
+        lambda: _request_with_retry(session, "https://host/", method=method)
+    )
+    assert len(session.request.mock_calls) == requests_made
+    assert all(isinstance(result, expected_type) for result in results)
+    if method == "GET":
+        # Waiters share the response, or raise copies chained to the one error
+        shared = [getattr(result, "__cause__", None) or result for result in results]
+        assert all(result is shared[0] for result in shared)
+
+
+class FakeRequests:
+    """Records the concurrency of requests, in total and per host."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.max_in_flight = {}
+
+    def __call__(self, session, url, delay=0.01, fail=False):
+        host = url.split("/")[2]
+        with self.lock:
+            self.in_flight[host] = self.in_flight.get(host, 0) + 1
+            total = sum(self.in_flight.values())
+            self.max_in_flight[host] = max(
+                self.max_in_flight.get(host, 0), self.in_flight[host]
+            )
+            self.max_in_flight["total"] = max(self.max_in_flight.get("total", 0), total)
+        time.sleep(delay)
+        with self.lock:
+            self.in_flight[host] -= 1
+        if fail:
+            raise RuntimeError(url)
+        return (session, url)
+
+
+@pytest.mark.parametrize("ordered", [False, True])
+def test_request_many(ordered):
+    timing_registry.reset()
+    fake = FakeRequests()
+    requests_ = [f"http://a/{i}" for i in range(12)] + [
+        {"url": "http://b/slow", "delay": 0.2},
+        {"url": "http://b/fail", "fail": True},
+    ]
+    results = list(
+        request_many(
+            iter(requests_),
+            request_fn=fake,
+            session=sentinel.session,
+            max_workers=4,
+            max_per_host=2,
+            ordered=ordered,
+        )
+    )
+    assert sorted(result.position for result in results) == list(range(14))
+    if ordered:
+        assert [result.position for result in results] == list(range(14))
+    else:
+        assert results[-1].position == 12
+    assert results[0].response == (sentinel.session, results[0].request)
+    failed = next(result for result in results if result.position == 13)
+    assert failed.response is None and isinstance(failed.error, RuntimeError)
+    assert all(result.duration > 0 for result in results)
+    assert fake.max_in_flight == {"a": 2, "b": 2, "total": 4}
+    assert timing_registry.summary()["_request_many_fetch"]["count"] == 14
+
+
+def test_request_many_ordered_bounds_buffered_results(mocker):
+    mocker.patch("python_core_example.requests.REQUEST_MANY_LOOKAHEAD", 2)
+    head_done = threading.Event()
+    started_before_head = []
+
+    def request_fn(session, url, delay=0.0):
+        if not head_done.is_set():
+            started_before_head.append(url)
+        time.sleep(delay)
+        if delay:
+            head_done.set()
+        return url
+
+    requests_ = [{"url": "http://a/0", "delay": 0.2}] + [
+        f"http://a/{i}" for i in range(1, 100)
+    ]
+    results = request_many(
+        iter(requests_),
+        request_fn=request_fn,
+        session=sentinel.session,
+        max_workers=2,
+        ordered=True,
+    )
+    assert [result.response for result in results] == ["http://a/0"] + requests_[1:]
+    # Only the lookahead (2 workers x 2) and the requests in flight are started while the head is slow
+    assert len(started_before_head) <= 2 * 2 + 2
+
+
+def test_request_many_defaults(mock_requests, mock_requests_response):
+    mock_requests_response.status_code = 200
+    mock_requests.get_adapter.return_value = Mock(_pool_maxsize=3)
+    results = list(request_many(["http://a/1"], session=mock_requests))
+    assert [result.response for result in results] == [mock_requests_response]
+
+
+def test_pool_size():
+    import requests
+
+    assert _pool_size(requests.Session()) == requests.adapters.DEFAULT_POOLSIZE
+
+
+@pytest_asyncio.fixture
+async def stub_server():
+    web = pytest.importorskip("aiohttp.web")
+    server = Mock(responses=[], in_flight=0, max_in_flight=0, delay=0)
+
+    async def handle(request):
+        server.in_flight += 1
+        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        await asyncio.sleep(server.delay)
+        server.in_flight -= 1
+        status, text = server.responses.pop(0) if server.responses else (200, "ok")
+        return web.Response(status=status, text=text)
+
+    app = web.Application()
+    app.router.add_get("/", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    server.url = f"http://127.0.0.1:{runner.addresses[0][1]}/"
+    yield server
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "responses, expectation, requests_made",
+    [
+        ([(503, "busy"), (200, "ok")], DoesNotRaise(), 2),
+        ([(400, "Please try again")] * 3, pytest.raises(RetryableError), 3),
+        ([(404, "missing")], pytest.raises(RuntimeError), 1),
+    ],
+)
+async def test_async_request_with_retry(
+    stub_server, responses, expectation, requests_made
+):
+    stub_server.responses = list(responses)
+    logger = Mock()
+    _request = async_request_with_retry(logger=logger, sleep_time=0, max_tries=3)
+    async with async_session() as session:
+        with expectation:
+            resp = await _request(session, stub_server.url)
+            assert resp.status == 200 and await resp.text() == "ok"
+    assert len(logger.debug.mock_calls) == requests_made
+
+
+@pytest.mark.asyncio
+async def test_async_request_with_retry_bounds_in_flight(stub_server):
+    stub_server.delay = 0.02
+    _request = async_request_with_retry(logger=Mock(), max_in_flight=3)
+    async with async_session() as session:
+        responses = await asyncio.gather(
+            *(_request(session, stub_server.url) for _ in range(10))
+        )
+    assert [resp.status for resp in responses] == [200] * 10
+    assert stub_server.max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_async_request_with_retry_connection_errors():
+    pytest.importorskip("aiohttp")
+    _request = async_request_with_retry(logger=Mock(), sleep_time=0, max_tries=2)
+    async with async_session() as session:
+        with pytest.raises(RetryableError):
+            await _request(session, "http://127.0.0.1:1/")
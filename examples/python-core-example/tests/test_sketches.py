@@ -0,0 +1,293 @@
+import array
+import json
+import threading
+
+import numpy
+import pytest
+from python_core_example import common, sketches
+
+
+@pytest.fixture
+def patch_path():
+    return "python_core_example.sketches"
+
+
+@pytest.fixture
+def latencies():
+    return numpy.random.default_rng(0).lognormal(size=200_000)
+
+
+def _assert_close(summary, expected, rel):
+    assert summary.keys() == expected.keys()
+    for key in ("count", "min", "max"):
+        assert summary[key] == expected[key]
+    for key in ("total", "mean", "stdev"):
+        assert summary[key] == pytest.approx(expected[key])
+    for key, value in summary.items():
+        assert value == pytest.approx(expected[key], rel=rel), key
+
+
+def test_tdigest_small_input_is_exact():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0, 10.0]
+    digest = sketches.TDigest()
+    for value in values:
+        digest.add(value)
+
+    _assert_close(digest.stats(), common.stats(values), rel=1e-12)
+
+
+@pytest.mark.parametrize("as_list", [True, False])
+def test_tdigest_add_many_matches_stats(latencies, as_list):
+    digest = sketches.TDigest()
+    digest.add_many(latencies.tolist() if as_list else latencies)
+
+    _assert_close(digest.stats(), common.stats(latencies), rel=0.01)
+    assert len(digest.centroids()) < digest.compression
+
+
+def test_tdigest_merge_serialized_shards(latencies):
+    shards = []
+    for shard in numpy.array_split(latencies, 8):
+        digest = sketches.TDigest()
+        digest.add_many(shard)
+        digest.add(float(shard[0]))
+        shards.append(json.dumps(digest.to_dict()))
+
+    merged = sketches.TDigest()
+    for state in shards:
+        merged.merge(sketches.TDigest.from_dict(json.loads(state)))
+
+    expected = common.stats(
+        numpy.concatenate(
+            [latencies, [shard[0] for shard in numpy.array_split(latencies, 8)]]
+        )
+    )
+    _assert_close(merged.stats(), expected, rel=0.01)
+
+
+def test_tdigest_empty():
+    digest = sketches.TDigest.from_dict(sketches.TDigest().to_dict())
+    digest.add_many([])
+    digest.add_many(numpy.array([]))
+
+    with pytest.raises(ValueError):
+        digest.stats()
+
+
+def _shard_values(seed):
+    return numpy.random.default_rng(seed).lognormal(size=10_000)
+
+
+def test_parallel_stats_merges_worker_sketches():
+    summary = sketches.parallel_stats(_shard_values, range(4), max_workers=2)
+
+    expected = common.stats(numpy.concatenate([_shard_values(i) for i in range(4)]))
+    _assert_close(summary, expected, rel=0.01)
+
+
+def test_parallel_sketch_sends_sketch_state(mock_process_pool, mock_future):
+    mock_future.result.return_value = sketches._sketch_shard(list, [1.0, 2.0], 100)
+
+    digest = sketches.parallel_sketch(list, [[1.0, 2.0], [1.0, 2.0]], max_workers=3)
+
+    assert digest.count == 4
+    assert digest.stats()["median"] == 1.5
+    mock_process_pool.assert_called_once_with(max_workers=3)
+    assert mock_process_pool.submit.call_count == 2
+    mock_process_pool.submit.assert_called_with(
+        sketches._sketch_shard, list, [1.0, 2.0], sketches.TDIGEST_COMPRESSION
+    )
+
+
+def test_rolling_stats_window():
+    rolling = sketches.RollingStats(window_millis=3_000, bucket_millis=1_000)
+    for second, value in enumerate([1.0, 2.0, 3.0, 4.0]):
+        rolling.add(value, timestamp=second * 1_000 + 500)
+    rolling.add_many([5.0, 6.0], timestamp=3_999)
+
+    summary = rolling.stats(timestamp=3_999)
+    assert (summary["count"], summary["min"], summary["max"]) == (5, 2.0, 6.0)
+
+    # The ring buffer slot for second 0 was recycled by second 3
+    assert rolling.sketch(timestamp=2_999).count == 2
+
+    summary = rolling.stats(timestamp=5_000)
+    assert (summary["count"], summary["min"]) == (3, 4.0)
+
+    with pytest.raises(ValueError):
+        rolling.stats(timestamp=10_000)
+
+
+def test_rolling_stats_drops_values_older_than_window():
+    rolling = sketches.RollingStats(window_millis=3_000, bucket_millis=1_000)
+    rolling.add(1.0, timestamp=10_000)
+    # Maps to the same ring buffer slot as the newer value, e.g. after the clock stepped backwards
+    rolling.add(2.0, timestamp=7_000)
+    rolling.add_many([3.0], timestamp=7_000)
+
+    summary = rolling.stats(timestamp=10_500)
+    assert (summary["count"], summary["min"], summary["max"]) == (1, 1.0, 1.0)
+
+    # Older values inside the window are still kept
+    rolling.add(4.0, timestamp=9_000)
+    assert rolling.stats(timestamp=10_500)["count"] == 2
+
+
+def test_rolling_stats_defaults_to_now(mock_time_helpers):
+    mock_time_helpers.return_value = 1_000_000
+    rolling = sketches.RollingStats()
+
+    rolling.add(1.0)
+    mock_time_helpers.return_value += sketches.ROLLING_WINDOW_MILLIS - 1
+
+    assert rolling.stats()["count"] == 1
+    mock_time_helpers.return_value += 1
+    assert rolling.sketch().count == 0
+
+
+def test_rolling_stats_threads():
+    rolling = sketches.RollingStats()
+    timestamp = rolling.bucket_millis * 1_000
+
+    def _add():
+        for i in range(1_000):
+            rolling.add(float(i), timestamp=timestamp + i % rolling.bucket_millis)
+
+    threads = [threading.Thread(target=_add) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert rolling.stats(timestamp=timestamp)["count"] == 8_000
+
+
+@pytest.mark.parametrize("window_millis, bucket_millis", [(0, 1), (1_000, 300)])
+def test_rolling_stats_invalid_window(window_millis, bucket_millis):
+    with pytest.raises(ValueError):
+        sketches.RollingStats(window_millis, bucket_millis)
+
+
+@pytest.fixture
+def events():
+    return numpy.random.default_rng(0).zipf(1.5, size=100_000)
+
+
+def test_hash64_stable_and_vectorized():
+    assert sketches.hash64("user") == sketches.hash64(b"user")
+    assert sketches.hash64(numpy.int64(-5)) == sketches.hash64(-5)
+    hashed = sketches._hash_many(numpy, numpy.array([-5, 0, 2 ** 40]))
+    assert hashed.tolist() == [sketches.hash64(i) for i in (-5, 0, 2 ** 40)]
+
+
+def test_sketches_hash_arrays_like_lists():
+    values = [1.5, 1.5, 2.5, -4.0]
+    assert sketches.hash64(numpy.float64(1.5)) == sketches.hash64(1.5)
+
+    counts = sketches.CountMinSketch()
+    counts.add_many(numpy.array(values))
+    counts.add_many(array.array("d", values))
+    assert counts.estimate(1.5) >= 4
+    assert counts.estimate(numpy.float64(2.5)) >= 2
+
+    from_array, from_list = sketches.HyperLogLog(), sketches.HyperLogLog()
+    from_array.add_many(numpy.array(values))
+    from_list.add_many(values)
+    assert from_array.registers == from_list.registers
+    from_array.merge(from_list)
+    assert round(from_array.count()) == 3
+
+
+def test_hyperloglog_count(events):
+    distinct = len(numpy.unique(events))
+    batched = sketches.HyperLogLog()
+    batched.add_many(events)
+    single = sketches.HyperLogLog()
+    single.add_many(events.tolist())
+
+    assert batched.registers == single.registers
+    assert batched.count() == pytest.approx(distinct, rel=0.03)
+
+
+def test_hyperloglog_small_and_string_counts():
+    sketch = sketches.HyperLogLog()
+    sketch.add_many(f"user-{i % 100}" for i in range(1_000))
+
+    assert sketch.count() == pytest.approx(100, rel=0.02)
+
+
+def test_hyperloglog_merge_serialized(events):
+    left, right = sketches.HyperLogLog(), sketches.HyperLogLog()
+    left.add_many(events[::2])
+    right.add_many(events[1::2])
+    merged = sketches.HyperLogLog.from_dict(json.loads(json.dumps(left.to_dict())))
+    merged.merge(right)
+
+    expected = sketches.HyperLogLog()
+    expected.add_many(events)
+    assert merged.registers == expected.registers
+    with pytest.raises(ValueError):
+        merged.merge(sketches.HyperLogLog(precision=10))
+
+
+def test_count_min_estimates(events):
+    batched = sketches.CountMinSketch()
+    batched.add_many(events)
+    single = sketches.CountMinSketch()
+    single.add_many(events.tolist())
+
+    assert batched.counts == single.counts
+    for item in (1, 2, 10):
+        true_count = int((events == item).sum())
+        assert true_count <= batched.estimate(item) <= true_count + 0.002 * len(events)
+
+
+def test_count_min_merge_serialized(events):
+    left, right = sketches.CountMinSketch(), sketches.CountMinSketch()
+    left.add_many(events[::2])
+    right.add_many(events[1::2])
+    merged = sketches.CountMinSketch.from_dict(json.loads(json.dumps(left.to_dict())))
+    merged.merge(right)
+
+    expected = sketches.CountMinSketch()
+    expected.add_many(events)
+    assert merged.counts == expected.counts
+    assert merged.total == len(events)
+    with pytest.raises(ValueError):
+        merged.merge(sketches.CountMinSketch(width=10))
+
+
+@pytest.mark.parametrize("as_list", [True, False])
+def test_space_saving_top(events, as_list):
+    summary = sketches.SpaceSaving(capacity=50)
+    summary.add_many(events.tolist() if as_list else events)
+
+    values, counts = numpy.unique(events, return_counts=True)
+    expected = values[numpy.argsort(-counts)][:5].tolist()
+    assert [item for item, _, _ in summary.top(5)] == expected
+    for item, count, error in summary.top(5):
+        true_count = int((events == item).sum())
+        assert count - error <= true_count <= count
+    assert summary.total == len(events)
+
+
+def test_space_saving_evicts_smallest():
+    summary = sketches.SpaceSaving(capacity=2)
+    for item in ["a", "a", "a", "b", "c"]:
+        summary.add(item)
+
+    assert summary.top() == [("a", 3, 0), ("c", 2, 1)]
+
+
+def test_space_saving_merge_serialized(events):
+    left, right = sketches.SpaceSaving(capacity=50), sketches.SpaceSaving(capacity=50)
+    left.add_many(events[::2])
+    right.add_many(events[1::2])
+    merged = sketches.SpaceSaving.from_dict(json.loads(json.dumps(left.to_dict())))
+    merged.merge(right)
+
+    assert merged.total == len(events)
+    for item, count, error in merged.top(5):
+        true_count = int((events == item).sum())
+        assert count - error <= true_count <= count
+    assert [item for item, _, _ in merged.top(3)] == [1, 2, 3]
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from python_core_example import common, tracing
+
+
+@pytest.fixture
+def tracer(mocker):
+    tracer = tracing.Tracer()
+    tracer.enable()
+    mocker.patch("python_core_example.common.tracer", tracer)
+    return tracer
+
+
+def test_time_api_nests_spans(tracer):
+    @common.time_api
+    def inner():
+        return 1
+
+    @common.time_api
+    def outer():
+        return inner() + inner()
+
+    assert outer() == 2
+
+    inner_1, inner_2, outer_span = tracer.spans()
+    assert outer_span.name == outer.__qualname__
+    assert outer_span.parent_id is None
+    assert inner_1.parent_id == inner_2.parent_id == outer_span.span_id
+    assert outer_span.start <= inner_1.start <= inner_1.end <= outer_span.end
+    assert tracer.current_span() is None
+
+
+def test_spans_in_threads_are_roots(tracer):
+    def _in_thread():
+        with tracer.span("thread"):
+            pass
+
+    with tracer.span("main"):
+        thread = threading.Thread(target=_in_thread)
+        thread.start()
+        thread.join()
+
+    thread_span, main_span = tracer.spans()
+    assert thread_span.parent_id is None
+    assert thread_span.track != main_span.track
+
+
+@pytest.mark.asyncio
+async def test_asyncio_tasks_nest_under_current_span(tracer):
+    @common.time_api
+    async def child():
+        await asyncio.sleep(0.01)
+
+    @common.time_api
+    async def parent():
+        await asyncio.gather(child(), child())
+
+    await parent()
+
+    *children, parent_span = tracer.spans()
+    assert [c.parent_id for c in children] == [parent_span.span_id] * 2
+    assert children[0].track != children[1].track
+
+
+def test_disabled_tracer_collects_nothing(tracer):
+    tracer.disable()
+
+    @common.time_api
+    def fn():
+        return 1
+
+    fn()
+    with tracer.span("block"):
+        pass
+
+    assert tracer.spans() == []
+
+
+def test_max_spans_drops_excess(tracer):
+    tracer.max_spans = 1
+    for _ in range(3):
+        with tracer.span("block"):
+            pass
+
+    assert len(tracer.spans()) == 1
+    assert tracer.dropped == 2
+
+
+def test_export_chrome_trace(tracer, tmp_path):
+    with tracer.span("outer"):
+        with tracer.span("inner"):
+            pass
+
+    path = tracer.export_chrome_trace(str(tmp_path / "trace.json"))
+
+    with open(path) as f:
+        trace = json.load(f)
+    metadata, inner, outer = trace["traceEvents"]
+    assert metadata["ph"] == "M"
+    assert (inner["name"], inner["ph"]) == ("inner", "X")
+    assert inner["args"]["parent_id"] == outer["args"]["span_id"]
+    assert inner["tid"] == outer["tid"]
+    assert outer["ts"] <= inner["ts"]
+    assert inner["dur"] <= outer["dur"]